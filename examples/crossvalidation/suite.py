@@ -15,6 +15,12 @@
 # split into batches for a given dataset. Use the flag shuffle=True if
 # you want to randomize the dataset.
 #
+# Loading the dataset and computing its hash key is the same work for every
+# repetition, so reset() does it through self.cached(): the result is
+# computed once, stored in results/.expsuite-cache and shared by all
+# repetitions and worker processes, as long as the 'dataset' parameter
+# does not change.
+#
 # Run this script from the command line on a single core: python suite.py -n1
 #
 # The output shows, how the dataset (here an array of consecutive
@@ -40,25 +46,36 @@ from numpy import *
 import hashlib
 import os
 
+def dataset_key(dataset):
+    """ returns a hash key of the dataset, which seeds its permutation. """
+    return int(hashlib.sha1(dataset).hexdigest()[:7], 16)
+
+def load_dataset(filename):
+    """ loads the dataset and returns it together with its hash key. """
+    dataset = load(filename)
+    return dataset, dataset_key(dataset)
+
 class MySuite(PyExperimentSuite):
     
     def __init__(self):
         PyExperimentSuite.__init__(self) 
         self.dataset = None
     
-    def crossvalidation(self, dataset, params, rep, shuffle=True):
+    def crossvalidation(self, dataset, params, rep, shuffle=True, key=None):
         """ This method takes a dataset in form of a numpy array of shape n x d,
             where n is the number of data points and d is the dimensionality of 
             the data. It further requires the current params dictionary and the
             current repetition number. The flag 'shuffle' determines, if the
             dataset should be shuffled before returning the training and testing
             batches. There will be params['repetitions'] many equally sized batches, 
-            the rest of the dataset is discarded.
+            the rest of the dataset is discarded. 'key' is the hash key of the
+            dataset (see dataset_key()), it is computed if not given.
         """
         if params['repetitions'] < 2:
             raise SystemExit('%i-fold cross validation does not make sense. Use at least 2 repetitions.'%params['repetitions'])
         
-        key = int(hashlib.sha1(dataset).hexdigest()[:7], 16)
+        if key is None:
+            key = dataset_key(dataset)
         indices = range(dataset.shape[0])
         if shuffle:
             # create permutation unique to dataset
@@ -90,8 +107,8 @@ class MySuite(PyExperimentSuite):
             n is the number of samples and d is the dimensionality of the data. 
             The method returns a training and testing array.
         """
-        data = load(os.path.join(params['dataset']))
-        self.train, self.test = self.crossvalidation(data, params, rep, shuffle=True)
+        data, key = self.cached(params, 'dataset', load_dataset, params['dataset'])
+        self.train, self.test = self.crossvalidation(data, params, rep, shuffle=True, key=key)
         
         # output for demonstration purposes
         print
@@ -8,9 +8,11 @@ exps = mysuite.get_exps()
 print 'lowest offset for experiment normal:', mysuite.get_value(exps[0], 0, 'offset', 'min')
 print 'lowest offset for experiment highstd:', mysuite.get_value(exps[1], 0, 'offset', 'min')
 
-# plot results
-plt.plot(mysuite.get_history(exps[0], 0, 'offset'), linewidth=2, color='blue', label='std=1')
-plt.plot(mysuite.get_history(exps[1], 0, 'offset'), linewidth=2, color='red', label='std=5')
+# plot results, downsampled to 1000 points per curve (the shape is kept)
+x, y = mysuite.get_history(exps[0], 0, 'offset', max_points=1000)
+plt.plot(x, y, linewidth=2, color='blue', label='std=1')
+x, y = mysuite.get_history(exps[1], 0, 'offset', max_points=1000)
+plt.plot(x, y, linewidth=2, color='red', label='std=5')
 plt.xlabel('iterations')
 plt.ylabel('offset')
 plt.title('sample mean offset to true mean')
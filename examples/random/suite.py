@@ -60,13 +60,11 @@ class MySuite(PyExperimentSuite):
         
     def save_state(self, params, rep, n):
         # save array as binary file
-        save(os.path.join(params['path'], params['name'], 
-            'array_%i.npy'%rep), self.numbers)
+        save(os.path.join(self.workdir, 'array_%i.npy'%rep), self.numbers)
 
     def restore_state(self, params, rep, n):
         # load array from file
-        self.numbers = load(os.path.join(params['path'], 
-            params['name'], 'array_%i.npy'%rep))
+        self.numbers = load(os.path.join(self.workdir, 'array_%i.npy'%rep))
         
 
 if __name__ == '__main__':
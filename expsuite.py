@@ -20,7 +20,7 @@
 #############################################################################
 
 from ConfigParser import ConfigParser
-from multiprocessing import Process, Pool, cpu_count
+from multiprocessing import Process, Pool, Value, cpu_count
 from numpy import *
 import traceback
 import sys
@@ -30,24 +30,1352 @@ import os, sys, time, itertools, re, optparse, types
 from datetime import datetime
 import fnmatch
 from collections import OrderedDict
+import collections
+import numbers
+from multiprocessing.pool import ThreadPool
+import copy
+import posixpath
+import threading
+import multiprocessing
+import Queue
+import signal
+import gzip
+import zlib
+import zipfile
+import struct
+import json
+import resource
+import bisect
+import glob
+import socket
+import select
+import fcntl
+import hashlib
+import ctypes
+import stat
+import gc
+import cPickle as pickle
+# the builtin any, all, min and max, shadowed by 'from numpy import *'
+import __builtin__
 
 def mp_runrep(args):
     """ Helper function to allow multiprocessing support. """
     return PyExperimentSuite.run_rep(*args)
 
+def run_serial(explist, ncores, initializer=None, initargs=()):
+    """ Executor backend: runs all repetitions one after the other in this process. """
+    if initializer:
+        initializer(*initargs)
+    return [mp_runrep(e) for e in explist]
+
+def run_processes(explist, ncores, initializer=None, initargs=(), maxtasks=None, timeout=None, retries=1, max_rss=None, supervise=False, demands=None, budget=None):
+    """ Executor backend: runs the repetitions in a pool of worker processes.
+        With a repetition timeout, a memory watermark, resource demands or 
+        supervise=True (used for iteration timeouts, so that timed out 
+        repetitions are retried) the workers are supervised, see 
+        run_supervised().
+    """
+    if timeout or max_rss or supervise or demands:
+        return run_supervised(explist, ncores, initializer, initargs, maxtasks, timeout, retries, max_rss, demands, budget)
+    pool = Pool(processes=ncores, initializer=initializer, initargs=initargs, maxtasksperchild=maxtasks)
+    try:
+        return pool.map(mp_runrep, explist)
+    finally:
+        pool.close()
+        pool.join()
+
+def supervised_worker(inbox, outbox, initializer, initargs, maxtasks, max_rss):
+    """ Helper function, main loop of a worker process of run_supervised().
+        runs the tasks from inbox and reports to outbox. the worker exits
+        (and is replaced) after maxtasks tasks, after a repetition was 
+        recycled and when its memory grew beyond max_rss bytes.
+    """
+    if initializer:
+        initializer(*initargs)
+    ntasks = 0
+    while True:
+        task = inbox.get()
+        if task is None:
+            break
+        i, e, nthreads = task
+        if nthreads:
+            limit_threads(nthreads)
+        try:
+            result = mp_runrep(e)
+        except Exception:
+            result = traceback.format_exc()
+            outbox.put((os.getpid(), i, 'failed', result))
+        else:
+            outbox.put((os.getpid(), i, 'done', result))
+        ntasks += 1
+        if (result == 'recycled' or (maxtasks and ntasks >= maxtasks)
+                or (max_rss and current_rss() > max_rss)):
+            break
+    outbox.put((os.getpid(), None, 'exit', None))
+
+def run_supervised(explist, ncores, initializer=None, initargs=(), maxtasks=None, timeout=None, retries=1, max_rss=None, demands=None, budget=None):
+    """ Executor backend (used by run_processes): runs the repetitions in ncores
+        supervised worker processes. Unlike with Pool.map, a worker that hangs
+        or dies does not block the whole run: 
+        - a repetition that runs longer than timeout seconds is killed with its 
+          worker, marked in its log and dispatched again (resuming through 
+          restore_state) up to retries times.
+        - a worker that dies is replaced, its repetition is marked and retried 
+          the same way.
+        - workers are replaced after maxtasks repetitions, when their memory 
+          grows beyond max_rss bytes, and when run_rep recycled a repetition.
+          recycled repetitions are dispatched again without counting as retry.
+        With demands, a list of (cores, memory bytes) per repetition (see 
+        resource_demand()), the repetitions are packed against budget, the
+        (cores, memory bytes) of the machine, instead of one per worker: 
+        largest demands first, every repetition that fits into what the 
+        running ones leave is started, in a new worker if none is idle, and
+        limited to its (rounded up) cores of BLAS/OpenMP threads.
+    """
+    outbox = multiprocessing.Queue()
+    pending = collections.deque(enumerate(explist))
+    results = [None] * len(explist)
+    attempts = [0] * len(explist)
+    workers = {}  # pid -> [process, inbox, task index or None, start time]
+
+    if demands:
+        # a repetition larger than the machine would never start, give it all
+        for i, (cores, memory) in enumerate(demands):
+            if cores > budget[0] or memory > budget[1]:
+                sys.stderr.write("%s repetition %i needs %g cores and %.0f MB, more than the %g cores and %.0f MB available\n"%(explist[i][1]['name'], explist[i][2], cores, memory / 1048576., budget[0], budget[1] / 1048576.))
+                demands[i] = (__builtin__.min(cores, budget[0]), __builtin__.min(memory, budget[1]))
+        # first fit decreasing
+        pending = collections.deque(sorted(pending, key=lambda task: demands[task[0]], reverse=True))
+
+    def spawn():
+        inbox = multiprocessing.Queue()
+        process = Process(target=supervised_worker, args=(inbox, outbox, initializer, initargs, maxtasks, max_rss))
+        process.daemon = True
+        process.start()
+        workers[process.pid] = [process, inbox, None, None]
+        return workers[process.pid]
+
+    def send(w, i, e):
+        nthreads = int(ceil(demands[i][0])) if demands else None
+        w[1].put((i, e, nthreads))
+        w[2], w[3] = i, time.time()
+
+    def pack():
+        running = [w[2] for w in workers.values() if w[2] is not None]
+        cores = budget[0] - __builtin__.sum(demands[i][0] for i in running)
+        memory = budget[1] - __builtin__.sum(demands[i][1] for i in running)
+        idle = [w for w in workers.values() if w[2] is None]
+        for i, e in list(pending):
+            if demands[i][0] <= cores and demands[i][1] <= memory:
+                pending.remove((i, e))
+                send(idle.pop() if idle else spawn(), i, e)
+                cores -= demands[i][0]
+                memory -= demands[i][1]
+
+    def retry(i, marker, pid):
+        e = explist[i]
+        mark_log(os.path.join(e[1]['path'], e[1]['name']), e[2], marker)
+        # the worker is gone, so the crash is published from here
+        publish_event(dict(event='crash', exp=e[1]['name'], rep=e[2], pid=pid, time=time.time(),
+                           status=marker.split(':')[1], error='worker %i %s'%(pid, marker.split(':')[1])))
+        attempts[i] += 1
+        if attempts[i] <= retries:
+            pending.append((i, e))
+        else:
+            sys.stderr.write("giving up on %s repetition %i after %i attempts\n"%(e[1]['name'], e[2], attempts[i]))
+            results[i] = marker
+
+    try:
+        while pending or __builtin__.any(w[2] is not None for w in workers.values()):
+            # dispatch to idle workers, start new ones as needed
+            if demands:
+                pack()
+            else:
+                while len(workers) < ncores and len(workers) < len(pending) + len([w for w in workers.values() if w[2] is not None]):
+                    spawn()
+                for w in workers.values():
+                    if w[2] is None and pending:
+                        send(w, *pending.popleft())
+
+            try:
+                pid, i, status, result = outbox.get(timeout=0.5)
+            except Queue.Empty:
+                pass
+            else:
+                w = workers.get(pid)
+                if status == 'exit':
+                    if w is not None:
+                        w[0].join()
+                        del workers[pid]
+                        if w[2] is not None:
+                            # dispatched after the worker decided to leave
+                            pending.appendleft((w[2], explist[w[2]]))
+                    continue
+                if w is not None:
+                    w[2], w[3] = None, None
+                if result == 'recycled':
+                    pending.append((i, explist[i]))
+                elif result in ('timeout', 'failed') or status == 'failed':
+                    if status == 'failed':
+                        sys.stderr.write("repetition failed in worker:\n%s\n"%result)
+                        publish_event(dict(event='crash', exp=explist[i][1]['name'], rep=explist[i][2], pid=pid,
+                                           time=time.time(), status='failed', error=result.strip().splitlines()[-1]))
+                    attempts[i] += 1
+                    if attempts[i] <= retries:
+                        pending.append((i, explist[i]))
+                    else:
+                        results[i] = result
+                else:
+                    results[i] = result
+
+            # kill repetitions that run too long, replace dead workers
+            for pid, w in workers.items():
+                process, inbox, i, started = w
+                if i is not None and timeout and time.time() - started > timeout:
+                    sys.stderr.write("repetition %i of %s timed out after %.0f seconds\n"%(explist[i][2], explist[i][1]['name'], time.time() - started))
+                    process.terminate()
+                    process.join()
+                    del workers[pid]
+                    retry(i, TIMEOUT_MARKER, pid)
+                elif not process.is_alive() and process.exitcode != 0:
+                    # normal exits are handled with their 'exit' message
+                    del workers[pid]
+                    if i is not None:
+                        sys.stderr.write("worker %i died (exit code %s) running repetition %i of %s\n"%(pid, process.exitcode, explist[i][2], explist[i][1]['name']))
+                        retry(i, KILLED_MARKER, pid)
+    finally:
+        for w in workers.values():
+            w[1].put(None)
+        for w in workers.values():
+            w[0].join(1)
+            if w[0].is_alive():
+                w[0].terminate()
+    return results
+
+def run_threads(explist, ncores, initializer=None, initargs=()):
+    """ Executor backend: runs the repetitions in a pool of threads. Useful if
+        iterate() releases the GIL (numpy, BLAS) or mostly waits for I/O. Each
+        repetition gets a shallow copy of the suite, so that attributes set in
+        reset() are not shared between concurrently running repetitions. The
+        threads share one working directory, so files of save_state() and 
+        restore_state() must be opened in self.workdir.
+    """
+    explist = [(copy.copy(e[0]),) + tuple(e[1:]) for e in explist]
+    pool = ThreadPool(processes=ncores, initializer=initializer, initargs=initargs)
+    try:
+        return pool.map(mp_runrep, explist)
+    finally:
+        pool.close()
+        pool.join()
+
+# available executor backends for do_experiment, selected with -x/--executor
+# or with the 'executor' parameter in the config file
+executors = {'serial': run_serial, 'process': run_processes,
+             'thread': run_threads}
+
+# environment variables that size the thread pools of BLAS/OpenMP libraries
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+def physical_cores():
+    """ Helper function to count the physical cores (without hyperthreads),
+        from /proc/cpuinfo if available, otherwise cpu_count().
+    """
+    try:
+        cores = set()
+        physical = None
+        for line in open('/proc/cpuinfo'):
+            if line.startswith('physical id'):
+                physical = line.split(':')[1].strip()
+            elif line.startswith('core id'):
+                cores.add((physical, line.split(':')[1].strip()))
+        if cores:
+            return len(cores)
+    except IOError:
+        pass
+    return cpu_count()
+
+# functions that resize the thread pool of a loaded BLAS/OpenMP library, by
+# a part of the library's file name
+THREAD_SETTERS = (('openblas', ('openblas_set_num_threads', 'openblas_set_num_threads64_')),
+                  ('mkl_rt', ('MKL_Set_Num_Threads',)),
+                  ('blis', ('bli_thread_set_num_threads',)),
+                  ('gomp', ('omp_set_num_threads',)),
+                  ('iomp', ('omp_set_num_threads',)))
+
+# size of the CPU mask of sched_setaffinity (glibc's cpu_set_t)
+CPU_SETSIZE = 1024
+
+def cpu_mask(cpus=()):
+    """ Helper function to build a cpu_set_t of the given CPUs for ctypes. """
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (CPU_SETSIZE // bits))()
+    for cpu in cpus:
+        mask[cpu // bits] |= 1 << (cpu % bits)
+    return mask
+
+def libc_function(name):
+    """ Helper function to return a function of the C library, or None. """
+    try:
+        return getattr(ctypes.CDLL(None, use_errno=True), name)
+    except (OSError, AttributeError):
+        return None
+
+def available_cpus():
+    """ Helper function to return the CPUs this process may run on. """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    getaffinity = libc_function('sched_getaffinity')
+    if getaffinity is not None:
+        mask = cpu_mask()
+        if getaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) == 0:
+            bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+            return [cpu for cpu in range(CPU_SETSIZE) if mask[cpu // bits] >> (cpu % bits) & 1]
+    return range(cpu_count())
+
+def set_affinity(cpus):
+    """ Helper function to pin the calling thread to the given CPUs, with 
+        os.sched_setaffinity (Python 3.3+) or the C library. returns False
+        if the platform does not support it.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return True
+    setaffinity = libc_function('sched_setaffinity')
+    if setaffinity is None:
+        return False
+    mask = cpu_mask(cpus)
+    if setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        raise OSError(ctypes.get_errno(), "sched_setaffinity: %s"%os.strerror(ctypes.get_errno()))
+    return True
+
+def loaded_thread_setters():
+    """ Helper function to return the functions that resize the thread pools
+        of the BLAS/OpenMP libraries loaded into this process (see 
+        THREAD_SETTERS), found in /proc/self/maps.
+    """
+    try:
+        paths = set(line.split()[-1] for line in open('/proc/self/maps') if '.so' in line)
+    except IOError:
+        return []
+    setters = []
+    for path in sorted(paths):
+        for part, names in THREAD_SETTERS:
+            if part in os.path.basename(path):
+                try:
+                    lib = ctypes.CDLL(path)
+                except OSError:
+                    continue
+                for name in names:
+                    if hasattr(lib, name):
+                        setters.append(getattr(lib, name))
+                        break
+    return setters
+
+def limit_threads(nthreads):
+    """ Helper function to limit the BLAS/OpenMP threads of this process. The
+        environment variables only affect libraries that are loaded later (numpy
+        is already loaded at this point), so the pools of loaded libraries are
+        resized with threadpoolctl if it is installed, otherwise through their
+        own functions. returns False if no loaded library could be limited.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(nthreads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        setters = loaded_thread_setters()
+        for setter in setters:
+            setter(ctypes.c_int(nthreads))
+        return bool(setters)
+    threadpool_limits(limits=nthreads)
+    return True
+
+def init_worker(nthreads, cpusets, counter, events=None):
+    """ Helper function to set up a worker (process or thread) of an executor:
+        limits its BLAS/OpenMP threads to nthreads, pins it to the next
+        CPU set of cpusets, if given, and connects it to the queue of live 
+        events (see Publisher).
+    """
+    set_event_queue(events)
+    if nthreads:
+        limit_threads(nthreads)
+    if cpusets:
+        with counter.get_lock():
+            i = counter.value
+            counter.value += 1
+        # pid 0 is the calling thread, so this pins threads, too
+        if not set_affinity(cpusets[i % len(cpusets)]) and i == 0:
+            logging.warning("pinning workers to CPUs is not supported on this platform")
+
+# markers that end the log (without newline) of an unfinished repetition.
+# recycled repetitions are continued, the others count as crashed
+ERROR_MARKER = 'exception:error'
+TIMEOUT_MARKER = 'exception:timeout'
+KILLED_MARKER = 'exception:killed'
+RECYCLED_MARKER = 'exception:recycled'
+CRASH_MARKERS = (ERROR_MARKER, TIMEOUT_MARKER, KILLED_MARKER)
+
+def log_marker(last):
+    """ Helper function to return the marker that the last line of a log (see
+        log_tail()) is, or None if it is a logged iteration. markers are 
+        written without newline, so a complete line is never a marker.
+    """
+    if last.endswith('\n'):
+        return None
+    for marker in CRASH_MARKERS + (RECYCLED_MARKER,):
+        if last.startswith(marker):
+            return marker
+    return None
+
+class IterationTimeout(Exception):
+    """ raised in iterate() when it runs longer than the iteration timeout. """
+    pass
+
+def raise_iteration_timeout(signum, frame):
+    """ Helper function, SIGALRM handler for the iteration timeout. """
+    raise IterationTimeout('iteration timed out')
+
+def current_rss():
+    """ Helper function to return the resident memory of this process in bytes,
+        from /proc if available, otherwise the peak from getrusage().
+    """
+    try:
+        f = open('/proc/self/statm')
+        pages = int(f.read().split()[1])
+        f.close()
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, ValueError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def peak_rss():
+    """ Helper function to return the peak resident memory of this process in
+        bytes (since the last reset_peak_rss()), from /proc if available,
+        otherwise from getrusage().
+    """
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reset_peak_rss():
+    """ Helper function to reset the peak resident memory of this process to
+        its current size, so that peaks are measured per repetition and not
+        over the lifetime of a worker. needs Linux 4.0 or newer.
+    """
+    try:
+        f = open('/proc/self/clear_refs', 'w')
+        f.write('5')
+        f.close()
+    except (IOError, OSError):
+        pass
+
+def available_memory():
+    """ Helper function to return the memory (bytes) available for new 
+        processes, MemAvailable from /proc/meminfo if available, otherwise 
+        the physical memory.
+    """
+    try:
+        for line in open('/proc/meminfo'):
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+def resource_demand(params):
+    """ Helper function to return the resources a repetition declares with the
+        parameters 'cores' (default 1) and 'memory' (MB, default 0), as 
+        (cores, memory bytes). either can be an expression of the other
+        parameters, quoted in the config file: memory = '8 * hidden**2 / 1e6'
+    """
+    demand = []
+    for name, default in (('cores', 1), ('memory', 0)):
+        value = params.get(name, default)
+        if isinstance(value, basestring):
+            try:
+                value = eval(value, globals(), dict(params))
+            except Exception as exc:
+                raise SystemExit("can't evaluate '%s = %s' of %s: %s"%(name, value, params['name'], exc))
+        demand.append(float(value))
+    return demand[0], int(demand[1] * 1048576)
+
+def object_census():
+    """ Helper function to count the live objects of this process by type, 
+        with their sizes (sys.getsizeof, which includes the data of numpy 
+        arrays that own it). the objects are found through the garbage 
+        collector: the containers it tracks and the objects they refer to.
+        returns {type name: [count, bytes]}.
+    """
+    census = {}
+    seen = set()
+    for container in gc.get_objects():
+        for obj in [container] + gc.get_referents(container):
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            cls = type(obj)
+            name = cls.__name__ if cls.__module__ == '__builtin__' else '%s.%s'%(cls.__module__, cls.__name__)
+            try:
+                size = sys.getsizeof(obj)
+            except TypeError:
+                size = 0
+            entry = census.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] += size
+    return census
+
+def write_allocation_report(filename, after_reset, at_end, top=10):
+    """ Helper function to write the object types that use the most memory
+        after reset() and those that grew the most during the iterations,
+        from two object_census() results.
+    """
+    f = open(filename, 'w')
+    f.write("top %i object types after reset():\n"%top)
+    for name, (count, size) in sorted(after_reset.items(), key=lambda item: -item[1][1])[:top]:
+        f.write("  %-40s %10i objects %10.1f MB\n"%(name, count, size / 1048576.))
+    f.write("top %i object types of iterate(), growth since reset():\n"%top)
+    growth = [(name, count - after_reset.get(name, [0, 0])[0], size - after_reset.get(name, [0, 0])[1])
+              for name, (count, size) in at_end.items()]
+    for name, count, size in sorted(growth, key=lambda item: -item[2])[:top]:
+        f.write("  %-40s %+10i objects %+10.1f MB\n"%(name, count, size / 1048576.))
+    f.close()
+
+def mark_log(fullpath, rep, marker):
+    """ Helper function to end the log of a repetition with a marker, for
+        repetitions that were stopped from outside their worker. the marker
+        can't be appended to a damaged compressed log, which is cut off at the
+        damage anyway.
+    """
+    logname = find_log(fullpath, rep)
+    if logname is None:
+        return
+    if logname.endswith('.gz'):
+        logging.warning("%s of %s is not marked in the compressed log"%(marker, logname))
+        return
+    f = open(logname, 'ab')
+    f.write(marker)
+    f.close()
+
+class BackgroundWriter(object):
+    """ Runs the writes of run_rep() (checkpoints and log lines) in a 
+        background thread, in the order they were put. At most depth writes
+        wait in the queue, put() blocks when it is full. The first error of a
+        write is raised again by the next put() or close().
+    """
+    def __init__(self, depth=2):
+        self.queue = Queue.Queue(depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='expsuite-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                break
+            if self.error is None:
+                try:
+                    task[0](*task[1:])
+                except Exception as exc:
+                    sys.stderr.write("background write failed:\n%s\n"%traceback.format_exc())
+                    self.error = exc
+            self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def put(self, fn, *args):
+        """ queues the call fn(*args). """
+        self.check()
+        self.queue.put((fn,) + args)
+
+    def drain(self):
+        """ waits until all queued writes are done, the thread keeps running. """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        """ waits until all writes are done. """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.check()
+
+# queue to the Publisher of the parent process, set in the workers by
+# init_worker(). None if the run is not published
+_events = None
+
+def set_event_queue(events):
+    """ Helper function to set the queue that publish_event() writes to. """
+    global _events
+    _events = events
+
+def publish_event(event):
+    """ Helper function to hand an event (dictionary) to the Publisher of the
+        parent process. never blocks: the event is dropped if the queue is full.
+    """
+    if _events is None:
+        return
+    try:
+        _events.put_nowait(event)
+    except Queue.Full:
+        pass
+
+def event_default(obj):
+    """ Helper function to convert values that json does not know, e.g. numpy
+        arrays and integers.
+    """
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+class Publisher(object):
+    """ Publishes the live events of a run on a Unix domain socket. Workers 
+        put their events into a bounded queue without blocking, a thread of
+        the parent process sends them on to the subscribers. A subscriber 
+        connects, sends one line of JSON with its filters, e.g.
+        {"exps": ["grid/*"], "tags": ["error"]}, and then receives one JSON 
+        event per line until the run ends. use subscribe() as a client.
+        events are dictionaries with 'event' (start, iteration, crash or 
+        finish), 'exp', 'rep', 'pid' and 'time', iteration events have the 
+        'iteration', its 'duration' and the logged 'values'.
+    """
+    def __init__(self, address, maxsize=10000):
+        self.address = address
+        self.queue = multiprocessing.Queue(maxsize)
+        # socket file of a crashed run, anything else is not ours to delete
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise SystemExit("can't publish on %s: it exists and is not a socket"%address)
+            os.remove(address)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(address)
+        self.server.listen(16)
+        self.subscribers = []  # [socket, experiment patterns, tags]
+        self.lock = threading.Lock()
+        self.running = True
+        self.threads = [threading.Thread(target=self.accept, name='expsuite-accept'),
+                        threading.Thread(target=self.dispatch, name='expsuite-publish')]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def accept(self):
+        """ accepts subscribers and reads their filters. """
+        while self.running:
+            if not select.select([self.server], [], [], 0.2)[0]:
+                continue
+            try:
+                conn = self.server.accept()[0]
+                conn.settimeout(1.0)
+                request = ''
+                while not request.endswith('\n'):
+                    data = conn.recv(4096)
+                    if not data:
+                        break
+                    request += data
+                filters = json.loads(request or '{}')
+            except (socket.error, ValueError):
+                continue
+            exps, tags = filters.get('exps'), filters.get('tags')
+            with self.lock:
+                self.subscribers.append([conn, exps, set(tags) if tags else None])
+
+    def dispatch(self):
+        """ sends the events from the queue to the subscribers whose filters
+            match, until the run has ended and the queue is empty.
+        """
+        while True:
+            try:
+                event = self.queue.get(timeout=0.2)
+            except Queue.Empty:
+                if not self.running:
+                    break
+                continue
+            except Exception:
+                # e.g. a worker was killed while it was writing
+                logging.warning("could not read a live event: %s"%traceback.format_exc())
+                continue
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for sub in subscribers:
+                conn, exps, tags = sub
+                if exps and not __builtin__.any(fnmatch.fnmatch(event['exp'], e) for e in exps):
+                    continue
+                out = event
+                if tags and 'values' in event:
+                    values = dict((k, v) for k, v in event['values'].iteritems() if k in tags)
+                    if not values:
+                        continue
+                    out = dict(event, values=values)
+                try:
+                    conn.sendall(json.dumps(out, default=event_default) + '\n')
+                except socket.error:
+                    # gone or too slow
+                    with self.lock:
+                        self.subscribers.remove(sub)
+                    conn.close()
+
+    def close(self):
+        """ sends the remaining events, disconnects the subscribers and removes
+            the socket.
+        """
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        for sub in self.subscribers:
+            sub[0].close()
+        self.server.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+def subscribe(address, exps=None, tags=None):
+    """ generator over the live events of a run that is published on address
+        (the --publish socket), see Publisher. exps is an experiment name 
+        pattern or list of patterns (fnmatch), tags a tag or list of tags: 
+        iteration events are only sent if they have one of them, with only
+        those values. ends when the run ends.
+    """
+    if isinstance(exps, basestring):
+        exps = [exps]
+    if isinstance(tags, basestring):
+        tags = [tags]
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    sock.sendall(json.dumps({'exps': exps, 'tags': tags}) + '\n')
+    f = sock.makefile('rb')
+    try:
+        for line in f:
+            yield json.loads(line)
+    finally:
+        f.close()
+        sock.close()
+
 def progress(params, rep):
     """ Helper function to calculate the progress made on one experiment. """
     name = params['name']
     fullpath = os.path.join(params['path'], params['name'])
-    logname = os.path.join(fullpath, '%i.log'%rep)
-    if os.path.exists(logname):
-        logfile = open(logname, 'r')
-        lines = logfile.readlines()
-        logfile.close()
-        return int(100 * len(lines) / params['iterations'])
+    logname = find_log(fullpath, rep)
+    if logname is not None:
+        nlines, last = log_tail(logname)
+        return int(100 * nlines / params['iterations'])
     else: 
         return 0
 
+def parse_value(val):
+    """ Helper function to convert a logged value (string) back to float, int,
+        list etc. values that can't be evaluated are returned as string.
+    """
+    try:
+        return eval(val)
+    except (NameError, SyntaxError):
+        return val
+
+# first bytes of a gzip file, used to detect compressed logs
+GZIP_MAGIC = '\x1f\x8b'
+
+def find_log(fullpath, rep):
+    """ Helper function to find the log file of a repetition, which is either
+        %i.log or the compressed %i.log.gz. returns None if there is none.
+    """
+    logname = os.path.join(fullpath, '%i.log'%rep)
+    for filename in (logname, logname + '.gz'):
+        if file_exists(filename):
+            return filename
+    return None
+
+def open_log(logname, mode='r', compress=False):
+    """ Helper function to open a log file for writing, through a gzip
+        compressor if compress is True.
+    """
+    if compress:
+        return gzip.open(logname, mode + 'b')
+    return open(logname, mode)
+
+def iter_log(logname, start=0, chunksize=65536):
+    """ Helper function to iterate over the lines of a plain or gzip compressed
+        log file, streaming without reading the whole file into memory. A
+        compressed log that was cut off (e.g. because of a crash) yields all
+        lines up to its last flush point. iteration starts at line start,
+        with a seek if the log has an offset index.
+    """
+    count = index_count(logname) if start > 0 else None
+    if count is not None and count >= start:
+        idxfile = open(logname + '.idx', 'rb')
+        offset = index_offset(idxfile, start - 1)
+        idxfile.close()
+        f = open(logname, 'rb')
+        f.seek(offset)
+        try:
+            for line in f:
+                yield line
+        finally:
+            f.close()
+        return
+    if start > 0:
+        for line in itertools.islice(iter_log(logname), start, None):
+            yield line
+        return
+
+    f = open_file(logname)
+    try:
+        head = f.read(2)
+        if head != GZIP_MAGIC:
+            # plain text log
+            pending = head
+            while True:
+                chunk = f.read(chunksize)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split('\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield line + '\n'
+            if pending:
+                yield pending
+            return
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        pending = ''
+        chunk = head
+        while chunk:
+            try:
+                data = decompressor.decompress(chunk)
+                # appended gzip members follow each other
+                while decompressor.unused_data:
+                    rest = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    data += decompressor.decompress(rest)
+            except zlib.error:
+                logging.warning("compressed log %s is damaged, reading it up to the damage"%logname)
+                break
+            lines = (pending + data).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+            chunk = f.read(chunksize)
+        if pending:
+            yield pending
+    finally:
+        f.close()
+
+# offset index sidecar of plain logs (%i.log.idx): one little endian uint64
+# per complete line, the byte offset where the line ends
+INDEX_ITEM = struct.Struct('<Q')
+
+def index_offset(idxfile, i):
+    """ Helper function to read the offset after line i from an open index
+        file, 0 for i < 0.
+    """
+    if i < 0:
+        return 0
+    idxfile.seek(i * INDEX_ITEM.size)
+    return INDEX_ITEM.unpack(idxfile.read(INDEX_ITEM.size))[0]
+
+def index_count(logname, maxrest=65536):
+    """ Helper function to return the number of lines recorded in the offset
+        index of a plain log file, or None if there is no index or if it does
+        not match the log (then it needs to be rebuilt with build_index()).
+        only a line without newline (crash or exception marker) may follow
+        the indexed lines.
+    """
+    idxname = logname + '.idx'
+    if not (os.path.isfile(idxname) and os.path.isfile(logname)):
+        return None
+    n = os.path.getsize(idxname) // INDEX_ITEM.size
+    size = os.path.getsize(logname)
+    idxfile = open(idxname, 'rb')
+    end = index_offset(idxfile, n - 1)
+    idxfile.close()
+    if end > size or size - end > maxrest:
+        return None
+    f = open(logname, 'rb')
+    f.seek(__builtin__.max(end - 1, 0))
+    rest = f.read()
+    f.close()
+    if end > 0:
+        if rest[:1] != '\n':
+            return None
+        rest = rest[1:]
+    if '\n' in rest:
+        return None
+    return n
+
+def build_index(logname):
+    """ Helper function to (re)build the offset index of a plain log file.
+        returns the number of indexed lines.
+    """
+    f = open(logname, 'rb')
+    idxfile = open(logname + '.idx', 'wb')
+    n, offset = 0, 0
+    for line in f:
+        offset += len(line)
+        if line.endswith('\n'):
+            idxfile.write(INDEX_ITEM.pack(offset))
+            n += 1
+    idxfile.close()
+    f.close()
+    return n
+
+def log_tail(logname):
+    """ Helper function to return the number of lines of a log file and its
+        last line ('' if empty). uses the offset index if there is one,
+        otherwise streams the log.
+    """
+    n = index_count(logname)
+    if n is None:
+        nlines, last = 0, ''
+        for last in iter_log(logname):
+            nlines += 1
+        return nlines, last
+    idxfile = open(logname + '.idx', 'rb')
+    f = open(logname, 'rb')
+    f.seek(index_offset(idxfile, n - 1))
+    last = f.read()
+    if last:
+        n += 1
+    elif n > 0:
+        start = index_offset(idxfile, n - 2)
+        f.seek(start)
+        last = f.read(index_offset(idxfile, n - 1) - start)
+    f.close()
+    idxfile.close()
+    return n, last
+
+def read_line(logname, n):
+    """ Helper function to return line n of a log file with a seek through the
+        offset index, or None if the log has no valid index or fewer lines.
+    """
+    count = index_count(logname)
+    if count is None or not 0 <= n < count:
+        return None
+    idxfile = open(logname + '.idx', 'rb')
+    start, end = index_offset(idxfile, n - 1), index_offset(idxfile, n)
+    idxfile.close()
+    f = open(logname, 'rb')
+    f.seek(start)
+    line = f.read(end - start)
+    f.close()
+    return line
+
+def summary_name(logname):
+    """ Helper function to return the filename of the running summary sidecar
+        of a (plain or compressed) log, %i.summary
+    """
+    return re.sub(r'\.log(\.gz)?$', '', logname) + '.summary'
+
+def new_summary():
+    """ Helper function to return an empty running summary. """
+    return {'lines': 0, 'tags': {}, 'other': []}
+
+def update_summary(summary, row, n):
+    """ Helper function to add the values of log line n (dictionary) to a
+        running summary: count, last, min/argmin, max/argmax and mean and
+        variance (Welford) of every numeric tag. other tags are only listed.
+    """
+    for tag, x in row.iteritems():
+        if isinstance(x, bool) or not isinstance(x, (int, long, float)):
+            if tag not in summary['other']:
+                summary['other'].append(tag)
+            continue
+        s = summary['tags'].get(tag)
+        if s is None:
+            s = summary['tags'][tag] = {'count': 0, 'mean': 0.0, 'm2': 0.0,
+                'min': x, 'argmin': n, 'max': x, 'argmax': n}
+        s['count'] += 1
+        s['last'] = x
+        if x < s['min']:
+            s['min'], s['argmin'] = x, n
+        if x > s['max']:
+            s['max'], s['argmax'] = x, n
+        delta = x - s['mean']
+        s['mean'] += delta / s['count']
+        s['m2'] += delta * (x - s['mean'])
+    summary['lines'] = n + 1
+
+# seconds between the writes of the running summary during run_rep(), it is
+# always written at the end. readers recompute a summary that is behind its log
+SUMMARY_INTERVAL = 1.0
+
+def write_summary(summary, logname):
+    """ Helper function to write the running summary of a log atomically. """
+    filename = summary_name(logname)
+    f = open(filename + '.tmp', 'w')
+    f.write(json.dumps(summary))
+    f.close()
+    os.rename(filename + '.tmp', filename)
+
+def read_summary(logname):
+    """ Helper function to return the running summary of a log, or None if
+        there is none or if it does not match the log any more.
+    """
+    filename = summary_name(logname)
+    if not file_exists(filename):
+        return None
+    f = open_file(filename)
+    try:
+        summary = json.load(f)
+    except ValueError:
+        return None
+    finally:
+        f.close()
+    # packed experiments don't change
+    if split_pack(logname)[0] is not None:
+        return summary
+    n = index_count(logname)
+    if n is not None:
+        return summary if summary['lines'] == n else None
+    return summary if os.path.getmtime(filename) >= os.path.getmtime(logname) else None
+
+def summarize_log(logname, n=None):
+    """ Helper function to compute the running summary of the first n complete
+        lines of a log by parsing it.
+    """
+    summary = new_summary()
+    for i, line in enumerate(itertools.islice(iter_log(logname), n)):
+        if not line.endswith('\n'):
+            break
+        row = {}
+        for pair in line.split():
+            try:
+                tag,val = pair.split(':')
+            except ValueError:
+                continue
+            row[tag] = parse_value(val)
+        update_summary(summary, row, i)
+    return summary
+
+def summary_stats(s):
+    """ Helper function to return the statistics of one tag of a running summary. """
+    return {'count': s['count'], 'last': s['last'], 'min': s['min'], 'argmin': s['argmin'],
+            'max': s['max'], 'argmax': s['argmax'], 'mean': s['mean'], 'var': s['m2'] / s['count']}
+
+def log_stamp(logname):
+    """ Helper function to return (mtime, size) of a log file, (0, 0) if there
+        is none. a changed stamp means that the log has changed.
+    """
+    if logname is None:
+        return (0, 0)
+    st = os.stat(logname)
+    return (st.st_mtime, st.st_size)
+
+def axis_index(values, value, rtol=1e-9):
+    """ Helper function to return the position of a parameter value of a cell
+        on its axis. floats are matched with the relative tolerance rtol: 
+        the experiment.cfg of a cell stores them with str(), which drops 
+        digits in Python 2, the parent's list with repr(). raises ValueError
+        if there is no match.
+    """
+    try:
+        return values.index(value)
+    except ValueError:
+        if not isinstance(value, numbers.Real):
+            raise
+    for i, v in enumerate(values):
+        if isinstance(v, numbers.Real) and abs(v - value) <= rtol * __builtin__.max(abs(v), abs(value)):
+            return i
+    raise ValueError("%r is not on the axis %r"%(value, values))
+
+def remove_log(logname):
+    """ Helper function to delete a log file together with its sidecar files. """
+    prefix = re.sub(r'\.log(\.gz)?$', '', logname)
+    sidecars = glob.glob(prefix + '.*.arr') + glob.glob(prefix + '.*.arr.json') + glob.glob(prefix + '.*.pyr.npz')
+    for filename in [logname, logname + '.idx', summary_name(logname)] + sidecars:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+# array-valued metrics (numpy arrays and long lists of numbers) are stored in
+# a binary sidecar per repetition and tag, %i.<tag>.arr, one row per value.
+# %i.<tag>.arr.json holds dtype and shape of the rows, the log holds a
+# reference to the row: tag:@arr[row]
+ARRAY_REF = '@arr['
+ARRAY_MIN_SIZE = 16
+
+# the most recently read array sidecars, by filename: (stamp, rows). at most
+# ARRAY_CACHE_SIZE are kept open, the least recently used are dropped
+_arrays = OrderedDict()
+ARRAY_CACHE_SIZE = 64
+
+def array_name(fullpath, rep, tag):
+    """ Helper function to return the filename of an array sidecar. """
+    return os.path.join(fullpath, '%i.%s.arr'%(rep, tag))
+
+def array_row(value):
+    """ Helper function to return the row of an array reference from the log,
+        None for other values.
+    """
+    if isinstance(value, basestring) and value.startswith(ARRAY_REF):
+        return int(value[len(ARRAY_REF):-1])
+    return None
+
+def as_array(value):
+    """ Helper function to return value as numpy array if it is stored in an
+        array sidecar, otherwise None.
+    """
+    if isinstance(value, ndarray):
+        arr = value
+    elif isinstance(value, (list, tuple)) and len(value) >= ARRAY_MIN_SIZE:
+        try:
+            arr = asarray(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    if arr.ndim == 0 or arr.size == 0 or arr.dtype.kind not in 'biufc':
+        return None
+    return arr
+
+def open_array(filename, meta=None):
+    """ Helper function to open an array sidecar for appending. returns
+        [file, meta, number of rows]. a row that was cut off by a crash is
+        dropped.
+    """
+    if meta is None:
+        f = open(filename + '.json')
+        meta = json.load(f)
+        f.close()
+    else:
+        f = open(filename + '.json.tmp', 'w')
+        json.dump(meta, f)
+        f.close()
+        os.rename(filename + '.json.tmp', filename + '.json')
+    rowsize = dtype(str(meta['dtype'])).itemsize * int(prod(meta['shape']))
+    f = open(filename, 'r+b' if os.path.exists(filename) else 'w+b')
+    f.seek(0, os.SEEK_END)
+    nrows = f.tell() // rowsize
+    f.truncate(nrows * rowsize)
+    f.seek(nrows * rowsize)
+    return [f, meta, nrows]
+
+def read_array(filename):
+    """ Helper function to return all complete rows of an array sidecar as one
+        array (memory mapped, or read into memory if packed).
+    """
+    archive, member = split_pack(filename)
+    # a sidecar that was replaced (e.g. rerun after --del) has another inode
+    st = os.stat(archive or filename)
+    size = get_pack(archive).getinfo(member).file_size if archive else st.st_size
+    stamp = (st.st_ino, st.st_mtime, size)
+    cached = _arrays.pop(filename, None)
+    if cached is not None and cached[0] == stamp:
+        _arrays[filename] = cached
+        return cached[1]
+    f = open_file(filename + '.json')
+    meta = json.load(f)
+    f.close()
+    dt, shape = dtype(str(meta['dtype'])), tuple(meta['shape'])
+    nrows = size // (dt.itemsize * int(prod(shape)))
+    if nrows == 0:
+        rows = zeros((0,) + shape, dtype=dt)
+    elif archive is None:
+        rows = memmap(filename, dtype=dt, mode='r', shape=(nrows,) + shape)
+    else:
+        f = open_file(filename)
+        rows = frombuffer(f.read(), dtype=dt)[:nrows * int(prod(shape))].reshape((nrows,) + shape)
+        f.close()
+    _arrays[filename] = (stamp, rows)
+    while len(_arrays) > ARRAY_CACHE_SIZE:
+        _arrays.popitem(last=False)
+    return rows
+
+def truncate_log(logname, n, newlogname=None, compress=False):
+    """ Helper function to keep only the first n lines of a log file. the lines
+        are written to newlogname (default: logname), compressed if compress
+        is True, and the old file is replaced atomically. plain logs with a 
+        valid offset index are truncated in place.
+    """
+    if newlogname is None:
+        newlogname = logname
+    count = index_count(logname)
+    if not compress and newlogname == logname and count is not None and n <= count:
+        idxfile = open(logname + '.idx', 'r+b')
+        end = index_offset(idxfile, n - 1)
+        idxfile.truncate(n * INDEX_ITEM.size)
+        idxfile.close()
+        f = open(logname, 'r+b')
+        f.truncate(end)
+        f.close()
+        return
+
+    tmpname = newlogname + '.tmp'
+    out = open_log(tmpname, 'w', compress)
+    idxfile = None if compress else open(tmpname + '.idx', 'wb')
+    offset = 0
+    for line in itertools.islice(iter_log(logname), n):
+        if not line.endswith('\n'):
+            line += '\n'
+        out.write(line)
+        offset += len(line)
+        if idxfile:
+            idxfile.write(INDEX_ITEM.pack(offset))
+    out.close()
+    if newlogname != logname:
+        remove_log(logname)
+    if idxfile:
+        idxfile.close()
+        os.rename(tmpname + '.idx', newlogname + '.idx')
+    elif os.path.exists(newlogname + '.idx'):
+        os.remove(newlogname + '.idx')
+    os.rename(tmpname, newlogname)
+
+# numbers of buckets of the levels of a pyramid, the per-bucket statistics of
+# one tag of a finished log (%i.<tag>.pyr.npz), for downsampled histories.
+# levels have at least PYRAMID_MIN_WIDTH iterations per bucket
+PYRAMID_SIZES = tuple(2**k for k in range(6, 17))
+PYRAMID_MIN_WIDTH = 16
+LEVEL_FIELDS = ('count', 'sumx', 'sumy', 'min', 'argmin', 'max', 'argmax')
+
+def pyramid_name(logname, tag):
+    """ Helper function to return the filename of the pyramid of a tag. """
+    return re.sub(r'\.log(\.gz)?$', '', logname) + '.%s.pyr.npz'%tag
+
+def new_level(start, stop, nbuckets):
+    """ Helper function to return an empty level: statistics of nbuckets 
+        buckets of equal width over the iterations start to stop.
+    """
+    level = {'start': start, 'stop': stop, 'count': zeros(nbuckets), 'sumx': zeros(nbuckets), 
+             'sumy': zeros(nbuckets), 'argmin': zeros(nbuckets), 'argmax': zeros(nbuckets)}
+    level['min'] = empty(nbuckets)
+    level['min'].fill(inf)
+    level['max'] = empty(nbuckets)
+    level['max'].fill(-inf)
+    return level
+
+def update_level(level, x, y):
+    """ Helper function to add a chunk of points (iterations x in ascending
+        order, values y) to the statistics of a level.
+    """
+    nbuckets = len(level['count'])
+    b = ((x - level['start']) * nbuckets // (level['stop'] - level['start'])).astype(int)
+    starts = r_[0, flatnonzero(diff(b)) + 1]
+    ub = b[starts]
+    seg = cumsum(r_[0, diff(b) != 0])
+    level['count'][ub] += diff(r_[starts, len(x)])
+    level['sumx'][ub] += add.reduceat(x, starts)
+    level['sumy'][ub] += add.reduceat(y, starts)
+    # minimum and maximum with their first iteration, earlier chunks win ties
+    for field, reduce, better in (('min', minimum, less), ('max', maximum, greater)):
+        extreme = reduce.reduceat(y, starts)
+        at = minimum.reduceat(where(y == extreme[seg], x, inf), starts)
+        i = better(extreme, level[field][ub])
+        level[field][ub[i]] = extreme[i]
+        level['arg' + field][ub[i]] = at[i]
+
+def level_points(level, method, start, stop):
+    """ Helper function to return the points (x, y) of a level in the 
+        iterations start to stop: the mean of every bucket, or its minimum and
+        maximum in the order they occurred.
+    """
+    if method == 'mean':
+        used = level['count'] > 0
+        x = level['sumx'][used] / level['count'][used]
+        y = level['sumy'][used] / level['count'][used]
+    else:
+        used = flatnonzero(level['count'] > 0)
+        x = r_[level['argmin'][used], level['argmax'][used]]
+        y = r_[level['min'][used], level['max'][used]]
+        order = lexsort((r_[zeros(len(used)), ones(len(used))], x))
+        x, y = x[order], y[order]
+        # minimum and maximum are the same point
+        keep = r_[True, diff(x) != 0]
+        x, y = x[keep], y[keep]
+    inside = (x >= start) & (x < stop)
+    return x[inside], y[inside]
+
+def lttb(chunks, start, stop, npoints):
+    """ Helper function to downsample the points in chunks (arrays x in 
+        ascending order and y) in the iterations start to stop to npoints 
+        points with Largest-Triangle-Three-Buckets: first and last point are 
+        kept, from every bucket in between the point that forms the largest
+        triangle with the point selected before and the mean of the next 
+        bucket. streams, only two buckets are kept in memory.
+    """
+    nbuckets = __builtin__.max(npoints - 2, 1)
+    selected = []
+    buckets = collections.deque()
+    rest_x, rest_y = zeros(0), zeros(0)
+
+    def select(bucket, target):
+        ax, ay = selected[-1]
+        bx, by = bucket
+        area = abs((ax - target[0]) * (by - ay) - (ax - bx) * (target[1] - ay))
+        i = argmax(area)
+        selected.append((bx[i], by[i]))
+
+    for x, y in chunks:
+        if not selected and len(x):
+            selected.append((x[0], y[0]))
+            x, y = x[1:], y[1:]
+        x, y = r_[rest_x, x], r_[rest_y, y]
+        if not len(x):
+            continue
+        b = ((x - start) * nbuckets // (stop - start)).astype(int)
+        cuts = flatnonzero(diff(b)) + 1
+        # the last bucket may continue in the next chunk
+        for bx, by in zip(split(x, cuts)[:-1], split(y, cuts)[:-1]):
+            buckets.append((bx, by))
+            if len(buckets) == 2:
+                cur = buckets.popleft()
+                select(cur, (buckets[0][0].mean(), buckets[0][1].mean()))
+        rest_x, rest_y = x[cuts[-1]:] if len(cuts) else x, y[cuts[-1]:] if len(cuts) else y
+
+    if len(rest_x) == 0:
+        return array([p[0] for p in selected]), array([p[1] for p in selected])
+    last = (rest_x[-1], rest_y[-1])
+    if len(rest_x) > 1:
+        buckets.append((rest_x[:-1], rest_y[:-1]))
+    while buckets:
+        cur = buckets.popleft()
+        target = (buckets[0][0].mean(), buckets[0][1].mean()) if buckets else last
+        select(cur, target)
+    selected.append(last)
+    return array([p[0] for p in selected]), array([p[1] for p in selected])
+
+# two-sided critical values of Student's t distribution, for the confidence
+# intervals of adaptive repetitions, by confidence level and degrees of freedom
+T_TABLE_DF = range(1, 31) + [40, 60, 120, inf]
+T_TABLE = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+           1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+           1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697,
+           1.684, 1.671, 1.658, 1.645],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+           2.021, 2.000, 1.980, 1.960],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750,
+           2.704, 2.660, 2.617, 2.576],
+}
+
+def t_critical(level, df):
+    """ Helper function to return the two-sided critical value of Student's t
+        distribution for a confidence level and df degrees of freedom, from 
+        T_TABLE. between tabulated degrees of freedom, the next lower one is
+        used, which gives a slightly wider (conservative) interval.
+    """
+    if level not in T_TABLE:
+        raise SystemExit("unexpected value %s for parameter 'ci_level'. Use one of %s."%(level, ', '.join(map(str, sorted(T_TABLE)))))
+    return T_TABLE[level][bisect.bisect_right(T_TABLE_DF, df) - 1]
+
+def ci_halfwidth(values, level):
+    """ Helper function to return the half width of the confidence interval 
+        of the mean of values, inf for less than two values.
+    """
+    n = len(values)
+    if n < 2:
+        return inf
+    return t_critical(level, n - 1) * std(values, ddof=1) / sqrt(n)
+
 def convert_param_to_dirname(param):
     """ Helper function to convert a parameter value to a valid directory name. """
     if type(param) == types.StringType:
@@ -55,12 +1383,181 @@ def convert_param_to_dirname(param):
     else:
         return re.sub("0+$", '0', '%f'%param)
 
+# extension of the archive files that --pack creates, one per top-level
+# experiment, next to where the experiment folder used to be
+PACK_EXT = '.pack'
+
+# open archives, by filename: (mtime, size, ZipFile)
+_packs = {}
+
+def get_pack(archive):
+    """ Helper function to return the (cached) ZipFile of a packed experiment.
+        the central directory of the archive serves as offset index, so that
+        members are read without unpacking.
+    """
+    st = os.stat(archive)
+    cached = _packs.get(archive)
+    if cached is None or cached[:2] != (st.st_mtime, st.st_size):
+        cached = (st.st_mtime, st.st_size, zipfile.ZipFile(archive, 'r', allowZip64=True))
+        _packs[archive] = cached
+    return cached[2]
+
+def split_pack(path):
+    """ Helper function to find out if path lies inside a packed experiment.
+        path can point into the archive (results/exp.pack/sub/0.log) or to
+        where the files were before packing (results/exp/sub/0.log). returns
+        (archive, member name) or (None, path) for normal files.
+    """
+    if os.path.isdir(path):
+        return None, path
+    if os.path.exists(path) and not path.endswith(PACK_EXT):
+        return None, path
+    parts = os.path.normpath(path).split(os.sep)
+    for i in range(1, len(parts) + 1):
+        head = os.sep.join(parts[:i]) or os.sep
+        member = '/'.join(parts[i:])
+        if head.endswith(PACK_EXT) and os.path.isfile(head):
+            return head, member
+        if not os.path.isdir(head):
+            if os.path.isfile(head + PACK_EXT):
+                return head + PACK_EXT, member
+            break
+    return None, path
+
+def open_file(path):
+    """ Helper function to open a file for reading (binary), also if it lies
+        inside a packed experiment.
+    """
+    archive, member = split_pack(path)
+    if archive is None:
+        return open(path, 'rb')
+    return get_pack(archive).open(member)
+
+def file_exists(path):
+    """ Helper function to check if a file exists, also inside packed experiments. """
+    archive, member = split_pack(path)
+    if archive is None:
+        return os.path.isfile(path)
+    return member in get_pack(archive).NameToInfo
+
+def file_mtimes(path, extensions):
+    """ Helper function to return the modification times of all files below
+        path with one of the given extensions, also inside packed experiments.
+    """
+    archive, member = split_pack(path)
+    if archive is None:
+        return [os.stat(os.path.join(dirname, filename)).st_mtime
+                for dirname, dirnames, filenames in os.walk(path)
+                for filename in filenames
+                if filename.endswith(extensions)]
+    prefix = member + '/' if member else ''
+    return [time.mktime(info.date_time + (0, 0, -1))
+            for info in get_pack(archive).infolist()
+            if info.filename.startswith(prefix) and info.filename.endswith(extensions)]
+
+# hidden folder below the results path, where --del moves old experiment
+# folders to before they are removed in the background
+TRASH_DIR = '.expsuite-trash'
+
+def unlink_file(filename):
+    """ Helper function to delete one file, returns the number of bytes freed. """
+    try:
+        size = os.lstat(filename).st_size
+        os.unlink(filename)
+        return size
+    except OSError:
+        return 0
+
+def remove_tree(path, nthreads=8):
+    """ Helper function to delete a directory tree with parallel unlinks.
+        returns the number of deleted files and bytes.
+    """
+    if not os.path.isdir(path):
+        return 1, unlink_file(path)
+    files, dirs = [], []
+    for dp, dn, fn in os.walk(path, topdown=False):
+        files.extend(os.path.join(dp, f) for f in fn)
+        dirs.append(dp)
+    pool = ThreadPool(processes=nthreads)
+    try:
+        sizes = pool.map(unlink_file, files, chunksize=__builtin__.max(1, len(files) // (4*nthreads)))
+    finally:
+        pool.close()
+        pool.join()
+    # bottom-up order from os.walk, subdirectories come first
+    for d in dirs:
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
+    return len(files), sum(sizes)
+
+def remove_in_background(paths):
+    """ Helper function to delete the given directory trees in a background
+        thread and report the reclaimed space when done. The thread is not a
+        daemon, so the interpreter waits for it before exiting.
+    """
+    def remove():
+        nfiles, nbytes = 0, 0
+        for path in paths:
+            f, b = remove_tree(path)
+            nfiles += f
+            nbytes += b
+        sys.stderr.write("deleted %i old experiment folder(s): %i files, %.1f MB reclaimed\n"%(len(paths), nfiles, nbytes / 1048576.))
+    thread = threading.Thread(target=remove, name='expsuite-delete')
+    thread.start()
+    return thread
+
+
+# hidden folder below the results path, where cached() keeps its results
+CACHE_DIR = '.expsuite-cache'
+
+def evict_cache(cachedir, limit, keep=None):
+    """ Helper function to delete the least recently used results of cached()
+        until the cache folder holds at most limit bytes. keep is never deleted.
+        the lock files stay, deleting them could let two processes hold the
+        lock of the same entry.
+    """
+    entries = []
+    for filename in os.listdir(cachedir):
+        if filename.endswith('.pkl'):
+            path = os.path.join(cachedir, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # evicted by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    total = __builtin__.sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path != keep:
+            total -= unlink_file(path)
+
 
 class PyExperimentSuite(object):
     
     # change this in subclass, if you support restoring state on iteration level
     restore_supported = False
-    
+
+    # executor backend of the current run, set by do_experiment()
+    executor = None
+
+    # iteration timeout (seconds) and memory watermark (bytes) of the current
+    # run, set by do_experiment()
+    iteration_timeout = None
+    max_rss = None
+
+    # folder of the results of cached(), by default CACHE_DIR below the
+    # results path of the running experiment
+    cache_dir = None
+
+    # absolute experiment folder and results path of the running repetition,
+    # set by run_rep()
+    workdir = None
+    results_path = None
+
     def __init__(self):
         self.parse_opt()
         
@@ -82,7 +1579,52 @@ class PyExperimentSuite(object):
             help="your experiments config file")
         optparser.add_option('-n', '--numcores',
             action='store', dest='ncores', type='int', default=cpu_count(), 
-            help="number of processes you want to use, default is %i"%cpu_count())  
+            help="number of processes you want to use, default is %i"%cpu_count())
+        optparser.add_option('-x', '--executor',
+            action='store', dest='executor', type='choice', choices=sorted(executors.keys()), default=None,
+            help="how to run the repetitions: %s. default is 'executor' from the config file, otherwise serial for -n1 and process else"%', '.join(sorted(executors.keys())))
+        optparser.add_option('-t', '--threads',
+            action='store', dest='threads', type='string', default=None,
+            help="number of BLAS/OpenMP threads per worker, or 'auto' to divide the physical cores among the workers. default is 'threads' from the config file, otherwise unlimited")
+        optparser.add_option('--pin',
+            action='store_true', dest='pin', default=None,
+            help="pin each worker to its own set of CPUs, default is 'pin' from the config file")
+        optparser.add_option('--maxtasks',
+            action='store', dest='maxtasks', type='int', default=None,
+            help="replace each worker process after this many repetitions, default is 'maxtasks' from the config file")
+        optparser.add_option('--max-rss',
+            action='store', dest='max_rss', type='float', default=None,
+            help="memory watermark in MB: workers above it are replaced between repetitions (and between iterations if restore is supported). default is 'max_rss' from the config file")
+        optparser.add_option('--memory-budget',
+            action='store', dest='memory_budget', type='float', default=None,
+            help="memory in MB that repetitions declaring 'memory' are packed into, default is 'memory_budget' from the config file, otherwise the available memory")
+        optparser.add_option('--timeout',
+            action='store', dest='timeout', type='float', default=None,
+            help="wall clock timeout in seconds per repetition, default is 'timeout' from the config file")
+        optparser.add_option('--iteration-timeout',
+            action='store', dest='iteration_timeout', type='float', default=None,
+            help="timeout in seconds per iteration, default is 'iteration_timeout' from the config file")
+        optparser.add_option('--retries',
+            action='store', dest='retries', type='int', default=None,
+            help="how often a timed out or killed repetition is dispatched again, default is 'retries' from the config file, otherwise 1")
+        optparser.add_option('--cache-size',
+            action='store', dest='cache_size', type='float', default=None,
+            help="size limit of the cache of cached() in MB, default is 'cache_size' from the config file, otherwise 1024")
+        optparser.add_option('--profile-memory',
+            action='store_true', dest='profile_memory', default=None,
+            help="log the resident memory and its peak per iteration as _rss and _peak_rss (MB), default is 'profile_memory' from the config file")
+        optparser.add_option('--profile-objects',
+            action='store_const', const='objects', dest='profile_memory',
+            help="like --profile-memory, and report the object types that use the most memory after reset() and that grow during iterate(), per repetition in <rep>.allocations")
+        optparser.add_option('--recommend-cores',
+            action='store_true', dest='recommend_cores', default=False,
+            help="recommend the number of processes (-n) from the memory peaks of earlier runs (see --profile-memory) and the available memory")
+        optparser.add_option('--pipeline',
+            action='store', dest='pipeline', type='int', default=None,
+            help="write checkpoints and log lines in a background thread, at most this many iterations behind. default is 'pipeline' from the config file, otherwise off")
+        optparser.add_option('--publish',
+            action='store', dest='publish', type='string', default=None,
+            help="publish live events of the run on this Unix domain socket, default is 'publish' from the config file")
         optparser.add_option('-d', '--del',
             action='store_true', dest='delete', default=False, 
             help="delete experiment folder if it exists")
@@ -104,6 +1646,21 @@ class PyExperimentSuite(object):
         optparser.add_option('-R', '--rerun-recursive',
             action='store', dest='rerun_recursive', type='int', default=None, 
             help="this allows you to rerun many nested experiments by specifying the iteration after which everything will be re-executed" )  
+        optparser.add_option('--pack',
+            action='store_true', dest='pack', default=False,
+            help="pack each finished experiment into one archive file (%s)"%PACK_EXT)
+        optparser.add_option('--unpack',
+            action='store_true', dest='unpack', default=False,
+            help="unpack archived experiments into folders again")
+        optparser.add_option('-z', '--compress',
+            action='store_true', dest='compress', default=None,
+            help="write the repetition logs gzip compressed (%i.log.gz), default is 'compress' from the config file")
+        optparser.add_option('--compress-flush',
+            action='store', dest='compress_flush', type='int', default=None,
+            help="flush compressed logs every n iterations, default is 'compress_flush' from the config file, otherwise 1. a crash loses the iterations since the last flush")
+        optparser.add_option('--reindex',
+            action='store_true', dest='reindex', default=False,
+            help="rebuild the offset index of all existing plain logs")
         optparser.add_option('--debug', 
             action='store_true', dest="debug", default=False,
             help="Show additional debugging runtime messages")
@@ -127,13 +1684,42 @@ class PyExperimentSuite(object):
         """ go through all subdirectories starting at path and return the experiment
             identifiers (= directory names) of all existing experiments. A directory
             is considered an experiment if it contains a experiment.cfg file. 
+            Experiments in packed archives are returned as paths into the
+            archive, e.g. results/exp.pack/alpha1.0
         """
+        archive, member = split_pack(path)
+        if archive is not None:
+            return self.get_packed_exps(archive, member)
+
         exps = []
         for dp, dn, fn in os.walk(path):
+            dn[:] = [d for d in dn if d not in (TRASH_DIR, CACHE_DIR)]
             if 'experiment.cfg' in fn:
-                subdirs = [os.path.join(dp, d) for d in os.listdir(dp) if os.path.isdir(os.path.join(dp, d))]
+                subdirs = [os.path.join(dp, d) for d in os.listdir(dp) if os.path.isdir(os.path.join(dp, d)) and d not in (TRASH_DIR, CACHE_DIR)]
                 if all(map(lambda s: self.get_exps(s) == [], subdirs)):       
                     exps.append(dp)
+            for f in fn:
+                if f.endswith(PACK_EXT):
+                    exps.extend(self.get_packed_exps(os.path.join(dp, f)))
+        return exps
+
+    def get_packed_exps(self, archive, prefix=''):
+        """ returns the experiments (as paths into the archive) of a packed
+            experiment, optionally only those below prefix.
+        """
+        names = get_pack(archive).namelist()
+        dirs = set(posixpath.dirname(n) for n in names if posixpath.basename(n) == 'experiment.cfg')
+        # only leaf experiments, like for folders
+        parents = set()
+        for d in dirs:
+            while d:
+                d = posixpath.dirname(d)
+                parents.add(d)
+        exps = []
+        for d in sorted(dirs - parents):
+            if prefix and d != prefix and not d.startswith(prefix + '/'):
+                continue
+            exps.append(os.path.join(archive, *d.split('/')) if d else archive)
         return exps
     
     def items_to_params(self, items):
@@ -158,7 +1744,11 @@ class PyExperimentSuite(object):
         """ reads the parameters of the experiment (= path) given.
         """
         cfgp = ConfigParser()
-        cfgp.read(os.path.join(exp, cfgname))
+        cfgname = os.path.join(exp, cfgname)
+        if file_exists(cfgname):
+            f = open_file(cfgname)
+            cfgp.readfp(f, cfgname)
+            f.close()
         section = cfgp.sections()[0]
         params = self.items_to_params(cfgp.items(section))
         params['name'] = section
@@ -170,11 +1760,20 @@ class PyExperimentSuite(object):
         """
         exps = []
         for dp, dn, df in os.walk(path):
+            dn[:] = [d for d in dn if d not in (TRASH_DIR, CACHE_DIR)]
             if 'experiment.cfg' in df:
                 cfgp = ConfigParser()
                 cfgp.read(os.path.join(dp, 'experiment.cfg'))
                 if name in cfgp.sections():
                     exps.append(dp)
+            for f in df:
+                if f.endswith(PACK_EXT):
+                    archive = os.path.join(dp, f)
+                    for n in get_pack(archive).namelist():
+                        if posixpath.basename(n) == 'experiment.cfg':
+                            exp = os.path.join(archive, *posixpath.dirname(n).split('/'))
+                            if name == self.get_params(exp)['name']:
+                                exps.append(exp)
         return exps
             
     
@@ -195,12 +1794,72 @@ class PyExperimentSuite(object):
         cfgp.write(f)
         f.close()
                 
-    def get_history(self, exp, rep, tags):
+    def iter_history(self, exp, rep, tags, start=0, stop=None, step=1, arrays=True):
+        """ generator over the history of one experiment and one repetition,
+            streaming the log file with constant memory. 
+            tags can be a string, then the values of that tag are yielded (lines
+            without the tag are skipped), or a list of strings or 'all', then a 
+            dictionary of the requested tags present in each line is yielded.
+            start, stop and step select the lines (iterations) like a slice; the
+            other lines and the values of other tags are not parsed.
+            values of array-valued metrics are the rows of their sidecar (memory
+            mapped), or the references '@arr[row]' if arrays is False.
+        """
+        single = tags != 'all' and not hasattr(tags, '__iter__')
+        if single:
+            tags = [tags]
+        if tags != 'all':
+            tags = set(tags)
+            # cheap substring test before a line is split
+            needles = [tag + ':' for tag in tags]
+
+        logfile = find_log(exp, rep)
+        if logfile is None:
+            return
+
+        # lines before start are skipped with a seek if the log has an index
+        lines = iter_log(logfile, start)
+        if stop is not None or step != 1:
+            lines = itertools.islice(lines, 0, None if stop is None else __builtin__.max(stop - start, 0), step)
+        for line in lines:
+            row = {}
+            if tags == 'all' or __builtin__.any(n in line for n in needles):
+                row = self._parse_line(line, tags, exp, rep, arrays)
+            if single:
+                if row:
+                    yield row.values()[0]
+            else:
+                yield row
+
+    def _parse_line(self, line, tags, exp, rep, arrays=True):
+        """ returns the dictionary of the requested tags (set or 'all') in one
+            log line. references to array sidecars are resolved if arrays is True.
+        """
+        row = {}
+        for pair in line.split():
+            try:
+                tag,val = pair.split(':')
+            except ValueError:
+                logging.warning("Exp: {} rep: {} Result pair not in the required format".format(exp, rep))
+                continue
+            if tags == 'all' or tag in tags:
+                if arrays and val.startswith(ARRAY_REF):
+                    row[tag] = read_array(array_name(exp, rep, tag))[array_row(val)]
+                else:
+                    row[tag] = parse_value(val)
+        return row
+
+    def get_history(self, exp, rep, tags, max_points=None, method='lttb'):
         """ returns the whole history for one experiment and one repetition.
             tags can be a string or a list of strings. if tags is a string,
             the history is returned as list of values, if tags is a list of 
             strings or 'all', history is returned as a dictionary of lists
-            of values.
+            of values. use iter_history() to stream long histories instead.
+            the history of an array-valued metric is one array of shape 
+            (iterations, ...), memory mapped from its sidecar.
+            with max_points, a downsampled history of at most max_points 
+            points is returned instead of the list, as a tuple of arrays
+            (iterations, values), see get_downsampled().
         """
         params = self.get_params(exp)
            
@@ -210,40 +1869,35 @@ class PyExperimentSuite(object):
         # make list of tags, even if it is only one
         if tags != 'all' and not hasattr(tags, '__iter__'):
             tags = [tags] 
+
+        if max_points:
+            if tags == 'all':
+                tags = self.get_summary(exp, rep).keys()
+            results = dict((tag, self.get_downsampled(exp, rep, tag, max_points, method)) for tag in tags)
+            return results.values()[0] if len(tags) == 1 else results
         
         results = {}
-        logfile = os.path.join(exp, '%i.log'%rep)
-        try:
-            f = open(logfile)
-        except IOError:
-            if len(tags) == 1:
-                return []
+        for row in self.iter_history(exp, rep, tags, arrays=False):
+            for tag, val in row.iteritems():
+                if not tag in results:
+                    results[tag] = [val]
+                else:
+                    results[tag].append(val)
+
+        # array-valued metrics: their rows, without a copy if consecutive
+        for tag, values in results.items():
+            refs = [array_row(v) for v in values]
+            if __builtin__.all(r is None for r in refs):
+                continue
+            rows = read_array(array_name(exp, rep, tag))
+            if None in refs:
+                # some values were logged as text
+                results[tag] = [v if r is None else rows[r] for v, r in zip(values, refs)]
+            elif refs == range(refs[0], refs[0] + len(refs)):
+                results[tag] = rows[refs[0]:refs[0] + len(refs)]
             else:
-                return {}
+                results[tag] = rows[refs]
 
-        for line in f:
-            pairs = line.split()
-            logging.debug("exp:{} rep:{} tags:{} pairs:{}".format(exp, rep, tags, len(pairs)))
-            for pair in pairs:
-                try:
-                    tag,val = pair.split(':')
-                except:
-                    logging.warning("Exp: {} rep: {} Result pair not in the required format".format(exp, rep))
-                    continue
-		 
-                if tags == 'all' or tag in tags:
-                    if not tag in results:
-                        try:
-                            results[tag] = [eval(val)]
-                        except (NameError, SyntaxError):
-                            results[tag] = [val]
-                    else:
-                        try:
-                            results[tag].append(eval(val))
-                        except (NameError, SyntaxError):
-                            results[tag].append(val)
-                            
-        f.close()
         logging.debug("results:{}".format(results))
         if len(results) == 0:
             if len(tags) == 1:
@@ -257,6 +1911,97 @@ class PyExperimentSuite(object):
             return results
     
     
+    def get_downsampled(self, exp, rep, tag, max_points, method='lttb', start=0, stop=None):
+        """ returns the history of one numeric tag in the iterations start to 
+            stop, downsampled to at most max_points points, as a tuple of
+            arrays (iterations, values). method is one of
+                lttb: Largest-Triangle-Three-Buckets, keeps the visual shape
+              minmax: minimum and maximum of every bucket
+                mean: mean of every bucket (and mean iteration)
+            the log is streamed in chunks with bounded memory. for finished
+            logs, mean and minmax come from a pyramid of precomputed bucket
+            statistics (%i.<tag>.pyr.npz), so that zooming into a window
+            (start, stop) does not read the log again, as long as the window
+            is not too small for the finest level.
+        """
+        if method not in ('lttb', 'minmax', 'mean'):
+            raise ValueError("unknown downsampling method '%s', use lttb, minmax or mean"%method)
+        logname = find_log(exp, rep)
+        if logname is None:
+            return zeros(0), zeros(0)
+        nlines, last = log_tail(logname)
+        if not last.endswith('\n'):
+            nlines -= 1
+        stop = nlines if stop is None else __builtin__.min(stop, nlines)
+        if stop <= start:
+            return zeros(0), zeros(0)
+
+        # short enough already
+        if stop - start <= max_points:
+            points = list(self._iter_points(exp, rep, tag, start, stop))
+            if not points:
+                return zeros(0), zeros(0)
+            return concatenate([p[0] for p in points]), concatenate([p[1] for p in points])
+        if method == 'lttb':
+            return lttb(self._iter_points(exp, rep, tag, start, stop), start, stop, max_points)
+
+        nbuckets = max_points if method == 'mean' else __builtin__.max(max_points // 2, 1)
+        if split_pack(logname)[0] is None and nlines == self.get_params(exp)['iterations']:
+            pyramid = self._get_pyramid(exp, rep, tag, logname, nlines)
+            # the finest level with at most nbuckets buckets in the window
+            for level in reversed(pyramid):
+                inside = len(level['count']) * (stop - start) / float(nlines)
+                if nbuckets / 2. < inside <= nbuckets:
+                    return level_points(level, method, start, stop)
+
+        level = new_level(start, stop, nbuckets)
+        for x, y in self._iter_points(exp, rep, tag, start, stop):
+            update_level(level, x, y)
+        return level_points(level, method, start, stop)
+
+    def _get_pyramid(self, exp, rep, tag, logname, nlines):
+        """ returns the levels of the pyramid of a tag of a finished log, built
+            with one pass over the log if it is missing or outdated.
+        """
+        filename = pyramid_name(logname, tag)
+        stamp = log_stamp(logname)
+        sizes = [size for size in PYRAMID_SIZES if size * PYRAMID_MIN_WIDTH <= nlines]
+        if os.path.exists(filename):
+            f = load(filename)
+            try:
+                if tuple(f['stamp']) == stamp:
+                    return [dict([(field, f['%s_%i'%(field, size)]) for field in LEVEL_FIELDS] + 
+                        [('start', 0), ('stop', nlines)]) for size in sizes]
+            finally:
+                f.close()
+        pyramid = [new_level(0, nlines, size) for size in sizes]
+        for x, y in self._iter_points(exp, rep, tag, 0, nlines):
+            for level in pyramid:
+                update_level(level, x, y)
+        arrays = dict(('%s_%i'%(field, size), level[field]) for size, level in zip(sizes, pyramid)
+            for field in LEVEL_FIELDS)
+        f = open(filename + '.tmp', 'wb')
+        savez(f, stamp=array(stamp), **arrays)
+        f.close()
+        os.rename(filename + '.tmp', filename)
+        return pyramid
+
+    def _iter_points(self, exp, rep, tag, start=0, stop=None, chunksize=65536):
+        """ generator over the numeric values of a tag in the iterations start
+            to stop, in chunks of arrays (iterations, values).
+        """
+        xs, ys = [], []
+        for x, row in enumerate(self.iter_history(exp, rep, [tag], start, stop), start):
+            value = row.get(tag)
+            if isinstance(value, numbers.Number):
+                xs.append(x)
+                ys.append(value)
+                if len(xs) == chunksize:
+                    yield array(xs, dtype=float), array(ys, dtype=float)
+                    xs, ys = [], []
+        if xs:
+            yield array(xs, dtype=float), array(ys, dtype=float)
+
     def get_history_tags(self, exp, rep=0):
         """ returns all available tags (logging keys) of the given experiment 
             repetition. 
@@ -281,38 +2026,102 @@ class PyExperimentSuite(object):
                  min: returns the minimum value of the history
                  max: returns the maximum value of the history
                    #: (int) returns the value at that index
+            the log is streamed, only the values needed for 'which' are kept.
+            a positive index is read with a seek if the log has an offset index.
         """
-        history = self.get_history(exp, rep, tags)
+        single = tags != 'all' and (not hasattr(tags, '__iter__') or len(tags) == 1)
+        if tags != 'all' and not hasattr(tags, '__iter__'):
+            tags = [tags]
+
+        # last, min and max of numeric tags come from the running summary
+        logname = find_log(exp, rep)
+        if which in ('last', 'min', 'max') and logname is not None:
+            summary = read_summary(logname)
+            if summary is not None and (tags != 'all' or not summary['other']):
+                stats = summary['tags']
+                if tags == 'all' and stats:
+                    return dict((tag, stats[tag][which]) for tag in stats)
+                if tags != 'all' and __builtin__.all(tag in stats for tag in tags):
+                    if single:
+                        return stats[tags[0]][which]
+                    return dict((tag, stats[tag][which]) for tag in tags)
+
+        # line 'which' holds the values at that index if it has all tags
+        if type(which) == int and which >= 0 and tags != 'all' and logname is not None:
+            line = read_line(logname, which)
+            if line is not None:
+                row = self._parse_line(line, set(tags), exp, rep)
+                if len(row) == len(set(tags)):
+                    return row.values()[0] if single else row
+
+        # reduce every tag separately, like the lists of get_history
+        values = {}
+        counts = {}
+        for row in self.iter_history(exp, rep, tags):
+            for tag, val in row.iteritems():
+                counts[tag] = counts.get(tag, 0) + 1
+                if which == 'last':
+                    values[tag] = val
+                elif which == 'min':
+                    values[tag] = __builtin__.min(values[tag], val) if tag in values else val
+                elif which == 'max':
+                    values[tag] = __builtin__.max(values[tag], val) if tag in values else val
+                elif type(which) == int and which >= 0:
+                    if counts[tag] == which + 1:
+                        values[tag] = val
+                elif type(which) == int:
+                    if tag not in values:
+                        values[tag] = collections.deque(maxlen=-which)
+                    values[tag].append(val)
         
         # empty histories always return None
-        if len(history) == 0:
+        if len(counts) == 0:
             return None
-            
-        # distinguish dictionary (several tags) from list
-        if type(history) == dict:
-            for h in history:
-                if which == 'last':
-                    history[h] = history[h][-1]
-                if which == 'min':
-                    history[h] = min(history[h])
-                if which == 'max':
-                    history[h] = max(history[h])
-                if type(which) == int:
-                    history[h] = history[h][which]
-            return history
-            
-        else:
-            if which == 'last':
-                return history[-1]
-            if which == 'min':
-                return min(history)
-            if which == 'max':
-                return max(history)
-            if type(which) == int:
-                return history[which]
-            else: 
+
+        if type(which) == int:
+            for tag in counts:
+                if which >= 0 and tag not in values or which < 0 and len(values[tag]) < -which:
+                    raise IndexError('list index out of range')
+                if which < 0:
+                    values[tag] = values[tag][0]
+        elif which not in ('last', 'min', 'max'):
+            if single:
                 return None
+            # unknown 'which', like get_history()
+            return self.get_history(exp, rep, tags)
+
+        if single:
+            return values[values.keys()[0]]
+        return values
         
+    def get_summary(self, exp, rep, tags='all'):
+        """ returns running statistics of numeric tags for one experiment and
+            one repetition: count, last, min, argmin, max, argmax (iteration
+            of the min/max), mean and var (population variance). they are
+            maintained by run_rep in the %i.summary file, the log is only
+            parsed if that file is missing or outdated.
+            tags can be a string, then the statistics dictionary of that tag is
+            returned (None if it has no numeric values), or a list of strings
+            or 'all', then a dictionary of them is returned.
+        """
+        single = tags != 'all' and not hasattr(tags, '__iter__')
+        if single:
+            tags = [tags]
+
+        logname = find_log(exp, rep)
+        if logname is None:
+            summary = new_summary()
+        else:
+            summary = read_summary(logname)
+            if summary is None:
+                summary = summarize_log(logname)
+
+        stats = dict((tag, summary_stats(s)) for tag, s in summary['tags'].iteritems()
+            if tags == 'all' or tag in tags)
+        if single:
+            return stats.get(tags[0])
+        return stats
+
     def get_values_fix_params(self, exp, rep, tag, which='last', **kwargs):
         """ this function uses get_value(..) but returns all values where the
             subexperiments match the additional kwargs arguments. if alpha=1.0,
@@ -404,27 +2213,147 @@ class PyExperimentSuite(object):
                 results[tag] = aggregated
             
         return results
-        
-        
+
+    def get_cube(self, exp, tag, which='last', iterations=False):
+        """ returns the results of a grid (or list) experiment as a dense array
+            indexed by the parameter axes of the experiment and the repetition,
+            without parsing directory names: the cell of every subexperiment
+            is found from the values in its experiment.cfg.
+            returns (cube, mask, axes): cube holds the value of tag per cell and
+            repetition, chosen with 'which' like in get_value(). with 
+            iterations=True the whole history is returned instead, with an
+            additional last axis for the iteration. mask is True where a
+            repetition is missing or incomplete (or, with iterations=True,
+            where an iteration has no value), the cube is nan where there is
+            no (numeric) value at all. axes is an ordered dictionary of the axis names
+            (the parameters in alphabetical order, then 'repetition' and
+            'iteration') and their values.
+            the cube is cached in the experiment folder and refreshed 
+            incrementally: only repetitions whose logs changed since the last
+            call are read again, and only new or changed experiment.cfg files
+            of the cells are parsed.
+        """
+        params = self.get_params(exp)
+        axes = OrderedDict((p, params[p]) for p in sorted(params)
+            if hasattr(params[p], '__iter__') and not isinstance(params[p], dict)
+            and params.get('experiment') != 'single')
+        ncells = len(axes)
+        axes['repetition'] = range(params['repetitions'])
+        if iterations:
+            axes['iteration'] = range(params['iterations'])
+        shape = tuple(len(values) for values in axes.values())
+
+        # load the cache if it was built for the same axes
+        packed = split_pack(exp)[0] is not None
+        cachename = os.path.join(exp, '%s.%s.cube.npz'%(tag, 'history' if iterations else which))
+        signature = json.dumps(axes.items())
+        cube = None
+        # cell of each subexperiment (relative path) with the stamp of its
+        # experiment.cfg: [mtime, size, cell]
+        cells = {}
+        if not packed and os.path.exists(cachename):
+            cache = load(cachename)
+            try:
+                if cache['axes'].item() == signature and cache['cube'].shape == shape:
+                    cube, mask, stamps = cache['cube'], cache['mask'], cache['stamps']
+                    if 'cells' in cache.files:
+                        cells = json.loads(cache['cells'].item())
+            finally:
+                cache.close()
+        if cube is None:
+            cube = empty(shape)
+            cube.fill(nan)
+            mask = ones(shape, dtype=bool)
+            stamps = zeros(shape[:ncells + 1] + (2,))
+
+        changed = False
+        seen = zeros(shape[:ncells], dtype=bool)
+        found = set()
+        for se in self.get_exps(exp):
+            key = os.path.relpath(se, exp)
+            found.add(key)
+            cfgstamp = [0, 0] if packed else list(log_stamp(os.path.join(se, 'experiment.cfg')))
+            known = cells.get(key)
+            if known is not None and known[:2] == cfgstamp:
+                cell = tuple(known[2])
+            else:
+                sp = self.get_params(se)
+                try:
+                    cell = tuple(axis_index(axes[p], sp[p]) for p in axes.keys()[:ncells])
+                except (KeyError, ValueError):
+                    logging.warning("Exp: %s does not match the parameters of %s, skipped"%(se, exp))
+                    if cells.pop(key, None) is not None:
+                        changed = True
+                    continue
+                cells[key] = cfgstamp + [list(cell)]
+                changed = True
+            seen[cell] = True
+            for rep in axes['repetition']:
+                logname = find_log(se, rep)
+                stamp = (0, 0) if packed else log_stamp(logname)
+                if not packed and tuple(stamps[cell + (rep,)]) == stamp:
+                    continue
+                changed = True
+                stamps[cell + (rep,)] = stamp
+                cube[cell + (rep,)] = nan
+                mask[cell + (rep,)] = True
+                if logname is None:
+                    continue
+                if iterations:
+                    for n, row in enumerate(self.iter_history(se, rep, [tag], stop=params['iterations'])):
+                        if isinstance(row.get(tag), numbers.Number):
+                            cube[cell + (rep, n)] = row[tag]
+                            mask[cell + (rep, n)] = False
+                    continue
+                value = self.get_value(se, rep, tag, which)
+                if isinstance(value, numbers.Number):
+                    cube[cell + (rep,)] = value
+                    nlines, last = log_tail(logname)
+                    mask[cell + (rep,)] = nlines < params['iterations'] or not last.endswith('\n')
+
+        # forget cells whose subexperiment was deleted
+        for key in set(cells) - found:
+            del cells[key]
+            changed = True
+        if ncells:
+            for cell in zip(*nonzero(~seen)):
+                if stamps[cell].any():
+                    cube[cell], mask[cell], stamps[cell] = nan, True, 0
+                    changed = True
+
+        # write the cache atomically, concurrent readers see the old or new one
+        if changed and not packed:
+            tmpname = cachename + '.tmp'
+            f = open(tmpname, 'wb')
+            savez(f, cube=cube, mask=mask, stamps=stamps, axes=array(signature), cells=array(json.dumps(cells)))
+            f.close()
+            os.rename(tmpname, cachename)
+        return cube, mask, axes
+
     def haserror(self, params, rep):
         """ Helper function to identify exceptions on one experiment. """
         fullpath = os.path.join(params['path'], params['name'])
-        logname = os.path.join(fullpath, '%i.log'%rep)
-        if os.path.exists(logname):
-            logfile = open(logname, 'r')
-            lines = logfile.readlines()
-
-            logfile.close()
-            try: 
-                if "exception:error" in lines[-1]:
-                    return True
-                else:
-                    return False
-            except IndexError: #if lines are empty
-                return False
+        logname = find_log(fullpath, rep)
+        if logname is not None:
+            nlines, last = log_tail(logname)
+            return log_marker(last) in CRASH_MARKERS
         else: 
             return False
     
+    def rebuild_indexes(self, path='.'):
+        """ (re)builds the offset index of every plain log of the experiments
+            below path, e.g. for logs written by older versions.
+        """
+        for exp in self.get_exps(path):
+            if split_pack(exp)[0] is not None:
+                continue
+            params = self.get_params(exp)
+            for rep in range(params['repetitions']):
+                logname = find_log(exp, rep)
+                if logname is not None and not logname.endswith('.gz'):
+                    n = build_index(logname)
+                    print 'indexed %i lines of %s'%(n, logname)
+
     def browse(self): 
         """ go through all subfolders (starting at '.') and return information
             about the existing experiments. if the -B option is given, all 
@@ -461,30 +2390,17 @@ class PyExperimentSuite(object):
             
             print '%16s %s'%('experiment', d)
                            
-            try:
-                minfile = min(
-                    (os.path.join(dirname, filename)
-                    for dirname, dirnames, filenames in os.walk(fullpath)
-                    for filename in filenames
-                    if filename.endswith(('.log', '.cfg'))),
-                    key=lambda fn: os.stat(fn).st_mtime)
-            
-                maxfile = max(
-                    (os.path.join(dirname, filename)
-                    for dirname, dirnames, filenames in os.walk(fullpath)
-                    for filename in filenames
-                    if filename.endswith(('.log', '.cfg'))),
-                    key=lambda fn: os.stat(fn).st_mtime)
-            except ValueError:
+            mtimes = file_mtimes(fullpath, ('.log', '.log.gz', '.cfg'))
+            if not mtimes:
                 print '         started %s'%'not yet'
                 
             else:      
-                print '         started %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.stat(minfile).st_mtime))
+                print '         started %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(min(mtimes)))
                 
                 if haserror:
-                    print '     *** crashed %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.stat(maxfile).st_mtime))
+                    print '     *** crashed %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(max(mtimes)))
                 else:
-                    print '           ended %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.stat(maxfile).st_mtime))
+                    print '           ended %s'%time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(max(mtimes)))
             for k in ['repetitions', 'iterations']:
                 print '%16s %s'%(k, params[k])   
             
@@ -546,32 +2462,175 @@ class PyExperimentSuite(object):
         """
         # create experiment path and subdir
         fullpath = os.path.join(params['path'], params['name'])
-        self.mkdir(fullpath)
 
-        # delete old histories if --del flag is active
+        # delete old histories if delete flag is active
         if delete:
-            os.system('rm %s/*' % fullpath)
+            moved = self.move_to_trash(params)
+            if moved:
+                remove_in_background(moved)
+
+        self.mkdir(fullpath)
      
         # write a config file for this single exp. in the folder
         self.write_config_file(params, fullpath)
+
+    def move_to_trash(self, params):
+        """ renames an existing experiment folder and its packed archive into
+            the trash folder below params['path'] (same file system, so the
+            rename is atomic) and returns their new locations.
+        """
+        fullpath = os.path.join(params['path'], params['name'])
+        moved = []
+        for path in (fullpath, fullpath + PACK_EXT):
+            if not os.path.exists(path):
+                continue
+            trash = os.path.join(params['path'], TRASH_DIR)
+            self.mkdir(trash)
+            now = datetime.now().strftime('%Y_%m_%d__%H_%M_%S')
+            target = os.path.join(trash, '%s-%s-%i'%(os.path.relpath(path, params['path']).replace(os.sep, '_'), now, os.getpid()))
+            i = 0
+            while os.path.exists(target + ('.%i'%i if i else '')):
+                i += 1
+            target += '.%i'%i if i else ''
+            os.rename(path, target)
+            moved.append(target)
+        return moved
+
+    def delete_experiments(self, params):
+        """ moves the folders of the given experiments (parameter dictionary or
+            list of them) out of the way and deletes them in the background, so
+            that the new run can start immediately. what is left in the trash
+            folders by runs that were killed while deleting is removed, too.
+        """
+        if type(params) == types.DictType:
+            params = [params]
+        moved = []
+        for path in set(p['path'] for p in params if 'path' in p):
+            trash = os.path.join(path, TRASH_DIR)
+            if os.path.isdir(trash):
+                moved.extend(os.path.join(trash, t) for t in sorted(os.listdir(trash)))
+        for p in params:
+            if 'path' in p and 'name' in p:
+                moved.extend(self.move_to_trash(p))
+        if moved:
+            remove_in_background(moved)
+
+    def experiment_finished(self, exp):
+        """ returns True if all repetitions of the experiment (= path) have
+            all their iterations logged and did not crash.
+        """
+        params = self.get_params(exp)
+        for rep in range(params['repetitions']):
+            logname = find_log(exp, rep)
+            if logname is None:
+                return False
+            nlines, last = log_tail(logname)
+            if nlines < params['iterations'] or log_marker(last) is not None:
+                return False
+        return True
+
+    def pack_experiment(self, params):
+        """ consolidates the folder of a finished top-level experiment into one
+            archive file (zip, next to the folder) and removes the folder. The
+            query functions read packed experiments directly, unpack_experiment()
+            restores the folder. returns True if the experiment was packed.
+        """
+        fullpath = os.path.join(params['path'], params['name'])
+        archive = fullpath + PACK_EXT
+        if not os.path.isdir(fullpath):
+            print 'not packing %s: no experiment folder'%fullpath
+            return False
+        if os.path.exists(archive):
+            print 'not packing %s: %s exists'%(fullpath, archive)
+            return False
+        for exp in self.get_exps(fullpath):
+            if not self.experiment_finished(exp):
+                print 'not packing %s: %s is not finished'%(fullpath, exp)
+                return False
+
+        tmpname = archive + '.tmp'
+        zf = zipfile.ZipFile(tmpname, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        for dp, dn, fn in os.walk(fullpath):
+            for f in fn:
+                filename = os.path.join(dp, f)
+                arcname = os.path.relpath(filename, fullpath).replace(os.sep, '/')
+                # compressed logs are stored as they are
+                zf.write(filename, arcname, zipfile.ZIP_STORED if f.endswith('.gz') else zipfile.ZIP_DEFLATED)
+        zf.close()
+        os.rename(tmpname, archive)
+        nfiles, nbytes = remove_tree(fullpath)
+        print 'packed %s: %i files, %.1f MB into %s (%.1f MB)'%(fullpath, nfiles, nbytes / 1048576., archive, os.path.getsize(archive) / 1048576.)
+        return True
+
+    def unpack_experiment(self, params):
+        """ reverses pack_experiment(): extracts the archive of a top-level
+            experiment into its folder and removes the archive. returns True
+            if the experiment was unpacked.
+        """
+        fullpath = os.path.join(params['path'], params['name'])
+        archive = fullpath + PACK_EXT
+        if not os.path.isfile(archive):
+            print 'not unpacking %s: no archive %s'%(fullpath, archive)
+            return False
+        if os.path.exists(fullpath):
+            print 'not unpacking %s: folder exists'%fullpath
+            return False
+
+        tmpdir = fullpath + '.unpack-tmp'
+        zf = zipfile.ZipFile(archive, 'r', allowZip64=True)
+        zf.extractall(tmpdir)
+        # extractall does not keep the modification times
+        for info in zf.infolist():
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            os.utime(os.path.join(tmpdir, *info.filename.split('/')), (mtime, mtime))
+        zf.close()
+        os.rename(tmpdir, fullpath)
+        _packs.pop(archive, None)
+        os.remove(archive)
+        print 'unpacked %s'%fullpath
+        return True
         
     def rerun_recursive(self):
+        """ reruns all experiments found in nested experiment.cfg files. the
+            repetitions of all configs are planned first and then run together
+            in one worker pool.
+        """
         matched_filenames = []
         for root, dirnames, filenames in os.walk('.'):
+            dirnames[:] = [d for d in dirnames if d != TRASH_DIR]
             for filename in fnmatch.filter(filenames, "experiment.cfg"):
                 matched_filenames.append(os.path.join(os.getcwd(), root,filename))            
         
         sys.stderr.write("Found nested filenames: \n{}\n\n".format("\n - ".join(matched_filenames)))
+        self.init_logging()
+        self.options.rerun = self.options.rerun_recursive
+
+        # intermediate config files of grid and list experiments expand to the
+        # same repetitions as the nested ones, plan each repetition only once
+        explist = []
+        planned = set()
+        nconfigs = 0
         for filename in matched_filenames:            
             self.options.config = filename
-            self.options.rerun = self.options.rerun_recursive
-            sys.stderr.write("\n*******************\nRunning {}\n\n".format(filename))
             try:
                 self.parse_cfg()
             except IOError:
                 sys.stderr.write("Could not read filename {}".format(filename))
                 continue
-            self.start()
+            units = self.plan_experiment(self.get_paramlist())
+            if units is None:
+                continue
+            nconfigs += 1
+            for e in units:
+                key = (os.path.abspath(os.path.join(e[1]['path'], e[1]['name'])), e[2])
+                if key not in planned:
+                    planned.add(key)
+                    explist.append(e)
+
+        sys.stderr.write("\n*******************\nRunning {} repetitions of {} experiment configs\n\n".format(len(explist), nconfigs))
+        results = self.run_explist(self.skip_finished(explist))
+        skipped = len([r for r in results if r is False])
+        sys.stderr.write("\n*******************\nRerun finished: {} repetitions run, {} skipped\n".format(len(results) - skipped, skipped))
             
     
     def start(self):
@@ -583,6 +2642,34 @@ class PyExperimentSuite(object):
             self.browse()
             raise SystemExit
 
+        # --recommend-cores only looks at earlier runs
+        if self.options.recommend_cores:
+            ncores, peak = self.recommend_ncores(self.get_paramlist())
+            if peak is None:
+                print 'no memory peaks found, run the experiments with --profile-memory first'
+            else:
+                print 'largest peak %.0f MB, %.0f MB available: use -n %i'%(peak / 1048576., available_memory() / 1048576., ncores)
+            raise SystemExit
+
+        # --reindex only rebuilds offset indexes of existing logs
+        if self.options.reindex:
+            self.rebuild_indexes('.')
+            raise SystemExit
+
+        # --pack and --unpack only convert between folders and archives
+        if self.options.pack or self.options.unpack:
+            for params in self.get_paramlist():
+                if self.options.pack:
+                    self.pack_experiment(params)
+                else:
+                    self.unpack_experiment(params)
+            raise SystemExit
+
+        self.init_logging()
+        self.do_experiment(self.get_paramlist())
+                
+    def init_logging(self):
+        """ sets up logging (more verbose with --debug) before running experiments. """
         loglevel = logging.WARNING
         if self.options.debug:
             loglevel = logging.DEBUG
@@ -591,33 +2678,117 @@ class PyExperimentSuite(object):
             datefmt='%m-%d %H:%M')
 
         sys.setrecursionlimit(2000)
-        
-        # read main configuration file
+
+    def get_paramlist(self):
+        """ returns the parameter dictionaries of the experiments in the config
+            file, only the ones selected with -e if that option is used.
+        """
         paramlist = []
         for exp in self.cfgparser.sections():
             if not self.options.experiments or exp in self.options.experiments:
                 params = self.items_to_params(self.cfgparser.items(exp))
                 params['name'] = exp
                 paramlist.append(params)
-                
-        self.do_experiment(paramlist)
-                
+        return paramlist
     
     def do_experiment(self, params):
         """ runs one experiment programatically and returns.
             params: either parameter dictionary (for one single experiment) or a list of parameter
             dictionaries (for several experiments).
         """
+        explist = self.plan_experiment(params)
+        if explist is None:
+            return False
+
+        self.run_explist(self.skip_finished(explist))
+        self.adapt_repetitions(explist)
+        return True
+
+    def start_repetitions(self, params):
+        """ returns the number of repetitions an experiment with adaptive 
+            repetitions (parameter 'ci_tag') starts with: min_repetitions 
+            (default 3), or the number that an earlier run recorded in its
+            experiment.cfg.
+        """
+        start = params.get('min_repetitions', 3)
+        cfgname = os.path.join(params['path'], params['name'], 'experiment.cfg')
+        if os.path.exists(cfgname):
+            start = __builtin__.max(self.get_params(os.path.dirname(cfgname)).get('repetitions', start), start)
+        return __builtin__.min(start, params.get('max_repetitions', params['repetitions']))
+
+    def adapt_repetitions(self, explist):
+        """ adaptive repetitions: for every experiment with the parameter 
+            'ci_tag', the confidence interval (level 'ci_level', default 0.95)
+            of the mean of that tag at the final iteration is computed over the
+            repetitions. experiments whose interval is wider than 'ci_width' 
+            get more repetitions, estimated from the current width, up to 
+            'max_repetitions' (default 'repetitions'). repeats until all 
+            intervals are narrow enough or at their maximum. the number of 
+            repetitions is recorded in each experiment.cfg.
+        """
+        cells = OrderedDict()
+        for e in explist:
+            if 'ci_tag' in e[1]:
+                cells[os.path.join(e[1]['path'], e[1]['name'])] = e[1]
+        while cells:
+            more = []
+            for path, params in cells.items():
+                n = params['repetitions']
+                level = params.get('ci_level', 0.95)
+                width = 2 * self.get_histories_over_repetitions(path, params['ci_tag'],
+                    lambda column: ci_halfwidth(column, level))[-1]
+                maximum = params.get('max_repetitions', params['repetitions'])
+                if width <= params['ci_width'] or n >= maximum:
+                    sys.stderr.write("%s: %i repetitions, confidence interval of %s is %g wide\n"%(params['name'], n, params['ci_tag'], width))
+                    del cells[path]
+                    continue
+                # the width shrinks with the square root of the repetitions
+                target = int(ceil(n * (width / params['ci_width'])**2)) if isfinite(width) else 2 * n
+                params['repetitions'] = __builtin__.min(maximum, __builtin__.max(n + 1, target))
+                self.write_config_file(params, path)
+                more.extend((self, params, rep) for rep in xrange(n, params['repetitions']))
+            if more:
+                sys.stderr.write("running %i more repetitions of %i experiments\n"%(len(more), len(cells)))
+                self.run_explist(more)
+
+    def plan_experiment(self, params):
+        """ expands the parameters, creates the directories and config files and
+            returns the list of (suite, params, rep) units to run, without running
+            them. returns None if a parameter set misses required keys.
+        """
+        # delete old experiment folders if --del flag is active, before the
+        # intermediate config files are written
+        if self.options.delete:
+            self.delete_experiments(params)
+
+        # packed experiments are finished, don't run them again
+        if type(params) == types.DictType:
+            params = [params]
+        unpacked = []
+        for p in params:
+            if 'path' in p and 'name' in p and os.path.isfile(os.path.join(p['path'], p['name']) + PACK_EXT):
+                print 'skipping experiment %s: it is packed, use --unpack to run it again'%p['name']
+            else:
+                unpacked.append(p)
+        params = unpacked
+
         paramlist = self.expand_param_list(params)
         
         # create directories, write config files
         for pl in paramlist:
             # check for required param keys
             if ('name' in pl) and ('iterations' in pl) and ('repetitions' in pl) and ('path' in pl):
-               self.create_dir(pl, self.options.delete)
+               if 'ci_tag' in pl:
+                   if 'ci_width' not in pl:
+                       print 'Error: parameter set %s has ci_tag but no ci_width'%pl['name']
+                       return None
+                   if 'max_repetitions' not in pl:
+                       pl['max_repetitions'] = pl['repetitions']
+                   pl['repetitions'] = self.start_repetitions(pl)
+               self.create_dir(pl)
             else:
                 print 'Error: parameter set does not contain all required keys: name, iterations, repetitions, path'
-                return False
+                return None
             
         # create experiment list 
         explist = []
@@ -625,60 +2796,226 @@ class PyExperimentSuite(object):
         # expand paramlist for all repetitions and add self and rep number
         for p in paramlist:
             explist.extend(zip( [self]*p['repetitions'], [p]*p['repetitions'], xrange(p['repetitions']) ))
-                
-        # if only 1 process is required call each experiment seperately (no worker pool)
-        if self.options.ncores == 1:
-            for e in explist:
-                mp_runrep(e)
-        else:
-            # create worker processes    
-            pool = Pool(processes=self.options.ncores)
-            pool.map(mp_runrep, explist)
-        
-        return True        
-        
+
+        return explist
+
+    def rep_status(self, params, rep):
+        """ returns the state of one repetition from the end of its log, like
+            run_rep() sees it: 'done', 'partial' (started or recycled), 
+            'crashed' (ends with an error, timeout or killed marker) or 
+            'pending' (not started).
+        """
+        logname = find_log(os.path.join(params['path'], params['name']), rep)
+        if logname is None:
+            return 'pending'
+        nlines, last = log_tail(logname)
+        marker = log_marker(last)
+        if marker is not None:
+            nlines -= 1
+        if nlines == params['iterations']:
+            return 'done'
+        if marker in CRASH_MARKERS:
+            return 'crashed'
+        return 'partial' if nlines > 0 else 'pending'
+
+    def skip_finished(self, explist, nthreads=16):
+        """ checks the state of all repetitions in parallel threads, prints a
+            summary and returns the units that still need to run, so that
+            finished repetitions are not sent to the workers. with --rerun all
+            units are returned, run_rep() decides which ones to run again.
+        """
+        pool = ThreadPool(processes=nthreads)
+        try:
+            states = pool.map(lambda e: self.rep_status(e[1], e[2]), explist,
+                chunksize=__builtin__.max(1, len(explist) // (4*nthreads)))
+        finally:
+            pool.close()
+            pool.join()
+        counts = collections.Counter(states)
+        sys.stderr.write("%i repetitions: %i done, %i partial, %i pending, %i crashed\n"%(len(explist),
+            counts['done'], counts['partial'], counts['pending'], counts['crashed']))
+        if self.options.rerun:
+            return explist
+        return [e for e, state in zip(explist, states) if state != 'done']
+
+    def run_explist(self, explist):
+        """ runs the (suite, params, rep) units with the selected executor backend
+            and returns the results of run_rep (False for skipped repetitions).
+        """
+        paramlist = [e[1] for e in explist]
+        self.executor = self.get_executor(paramlist)
+        initargs = self.get_worker_setup(paramlist)
+
+        # live events, see Publisher
+        address = self.get_setting('publish', paramlist)
+        publisher = Publisher(address) if address else None
+        initargs += (publisher.queue if publisher else None,)
+        # the supervisor of run_supervised() publishes, too
+        set_event_queue(publisher.queue if publisher else None)
+
+        if self.executor == 'thread' and self.restore_supported:
+            logging.warning("the thread executor shares the working directory: save_state() and restore_state() must use self.workdir")
+
+        # worker recycling and timeouts
+        self.iteration_timeout = self.get_setting('iteration_timeout', paramlist)
+        max_rss = self.get_setting('max_rss', paramlist)
+        self.max_rss = None
+        if max_rss and self.executor == 'process':
+            # a watermark makes run_processes() supervise, only the supervisor
+            # dispatches recycled repetitions again
+            self.max_rss = int(max_rss * 1048576)
+        elif max_rss:
+            logging.warning("the memory watermark (max_rss) is ignored by the %s executor, it needs worker processes"%self.executor)
+        kwargs = {}
+        if self.executor == 'process':
+            kwargs = dict(maxtasks=self.get_setting('maxtasks', paramlist),
+                          timeout=self.get_setting('timeout', paramlist),
+                          retries=self.get_setting('retries', paramlist, 1),
+                          max_rss=self.max_rss,
+                          supervise=bool(self.iteration_timeout))
+
+        # resource declarations, packed against -n cores and the memory budget
+        if __builtin__.any('cores' in p or 'memory' in p for p in paramlist):
+            if self.executor == 'process':
+                budget = self.get_setting('memory_budget', paramlist)
+                kwargs['demands'] = [resource_demand(p) for p in paramlist]
+                kwargs['budget'] = (self.options.ncores, int(budget * 1048576) if budget else available_memory())
+            elif self.executor != 'serial':
+                logging.warning("the resource declarations 'cores' and 'memory' are only packed by the process executor")
+        try:
+            return executors[self.executor](explist, self.options.ncores, init_worker, initargs, **kwargs)
+        finally:
+            set_event_queue(None)
+            if publisher:
+                publisher.close()
+
+    def get_setting(self, name, paramlist, default=None):
+        """ returns a setting of the run: the command line option if given,
+            otherwise the parameter of the first experiment that has it,
+            otherwise default.
+        """
+        value = getattr(self.options, name, None)
+        if value is None:
+            for p in paramlist:
+                if name in p:
+                    return p[name]
+            return default
+        return value
+
+    def recommend_ncores(self, paramlist, headroom=0.9):
+        """ returns the largest number of worker processes that fit into the
+            available memory (times headroom), from the largest _peak_rss 
+            logged by earlier runs (--profile-memory) of the experiments of 
+            paramlist, and that peak in bytes. returns (cpu_count(), None) if
+            no peaks were logged.
+        """
+        peak = None
+        for params in paramlist:
+            for exp in self.get_exps(os.path.join(params['path'], params['name'])):
+                for rep in xrange(self.get_params(exp)['repetitions']):
+                    stats = self.get_summary(exp, rep, '_peak_rss')
+                    if stats is not None and (peak is None or stats['max'] * 1048576 > peak):
+                        peak = stats['max'] * 1048576
+        if peak is None:
+            return cpu_count(), None
+        ncores = int(available_memory() * headroom // peak)
+        return __builtin__.max(1, __builtin__.min(ncores, cpu_count())), peak
+
+    def get_worker_setup(self, paramlist):
+        """ returns the arguments for init_worker(): the BLAS/OpenMP threads per
+            worker (--threads or 'threads', 'auto' divides the physical cores
+            among the workers) and the CPU sets the workers are pinned to
+            (--pin or 'pin').
+        """
+        ncores = self.options.ncores
+        nthreads = self.get_setting('threads', paramlist)
+        if nthreads == 'auto':
+            nthreads = __builtin__.max(1, physical_cores() // ncores)
+        elif nthreads is not None:
+            nthreads = int(nthreads)
+            if nthreads * ncores > physical_cores():
+                logging.warning("%i workers with %i threads each oversubscribe the %i physical cores"%(ncores, nthreads, physical_cores()))
+
+        cpusets = []
+        if self.get_setting('pin', paramlist, False):
+            cpus = available_cpus()
+            size = __builtin__.max(1, len(cpus) // ncores)
+            cpusets = [set(cpus[i*size:(i+1)*size]) for i in range(__builtin__.min(ncores, len(cpus)))]
+
+        # the environment is inherited by workers and everything they start,
+        # the loaded libraries are limited by init_worker()
+        if nthreads:
+            for var in THREAD_ENV_VARS:
+                os.environ[var] = str(nthreads)
+            if not loaded_thread_setters():
+                try:
+                    import threadpoolctl
+                except ImportError:
+                    logging.warning("no loaded BLAS/OpenMP library could be limited to %i threads, only libraries loaded later follow %s"%(nthreads, THREAD_ENV_VARS[0]))
+        return nthreads, cpusets, Value('i', 0)
+
+    def get_executor(self, paramlist):
+        """ returns the name of the executor backend: the -x option if given,
+            otherwise the 'executor' parameter of the experiments, otherwise
+            serial (no worker pool) if only 1 process is required and process
+            else.
+        """
+        executor = self.get_setting('executor', paramlist)
+        if executor is None:
+            executor = 'serial' if self.options.ncores == 1 else 'process'
+        if executor not in executors:
+            raise SystemExit("unexpected value '%s' for executor. Use one of %s."%(executor, ', '.join(sorted(executors.keys()))))
+        return executor
+
        
     def run_rep(self, params, rep):
         """ run a single repetition including directory creation, log files, etc. """
         name = params['name']
-        fullpath = os.path.join(params['path'], params['name'])
-        logname = os.path.join(fullpath, '%i.log'%rep)
+        # absolute, because the working directory changes during the repetition
+        fullpath = os.path.abspath(os.path.join(params['path'], params['name']))
+        self.workdir = fullpath
+        self.results_path = os.path.abspath(params['path'])
+        logname = find_log(fullpath, rep)
+        # logs are written compressed with -z or the 'compress' parameter,
+        # otherwise existing logs keep their format
+        compress = self.options.compress if self.options.compress is not None else params.get('compress', None)
+        if compress is None:
+            compress = logname is not None and logname.endswith('.gz')
+        compress_flush = self.options.compress_flush if self.options.compress_flush is not None else params.get('compress_flush', 1)
+        newlogname = os.path.join(fullpath, '%i.log'%rep) + ('.gz' if compress else '')
+        cwd = os.getcwd()
         # check if repetition exists and has been completed
         restore = 0
         
         sys.stderr.write("Looking in path '{}'\n".format(fullpath))
 
 
-        if not os.path.exists(logname):
-            sys.stderr.write("log {} not found".format(logname))
+        if logname is None:
+            sys.stderr.write("log {} not found".format(newlogname))
 
         else:
             
-            logfile = open(logname, 'r')
-            lines = logfile.readlines()
+            # count the lines, with the offset index if there is one
+            nlines, last = log_tail(logname)
             
             #throw away the line that reports the error
-            try:
-                if "exception:error" in lines[-1]:
-                    lines = lines[:-1]
-            except IndexError: #if lines is empty
-                pass
-            
-            logfile.close()
+            error = log_marker(last) is not None
+            if error:
+                nlines -= 1
             
             # if completed, continue loop
-            if 'iterations' in params and len(lines) == params['iterations'] and not self.options.rerun:
+            if 'iterations' in params and nlines == params['iterations'] and not self.options.rerun:
                 return False
             # if not completed, check if restore_state is supported
             if not self.restore_supported:
                 # not supported, delete repetition and start over
                 # print 'restore not supported, deleting %s' % logname
-                os.remove(logname)
+                remove_log(logname)
                 restore = 0
-            elif self.options.rerun and len(lines) < self.options.rerun:
+            elif self.options.rerun and nlines < self.options.rerun:
                 sys.stderr.write("Requested experiment has not reached this iteration")
                 return False
-            elif self.options.rerun and len(lines) >= self.options.rerun:
+            elif self.options.rerun and nlines >= self.options.rerun:
                 logging.debug("Forced reruning after iteration %d\n", self.options.rerun)
                 
                 #backup existing logfile
@@ -686,59 +3023,159 @@ class PyExperimentSuite(object):
                 shutil.copy(logname, "{}.{}.bak".format(logname, now))
                 
                 #trim file to contain only repetitions we need
-                lines = lines[0:self.options.rerun]
-                print len(lines)
-                logfile = open(logname, 'w')
-                logfile.write("".join(lines))
-                logfile.close()
+                truncate_log(logname, self.options.rerun, newlogname, compress)
                 
                 restore = self.options.rerun
             else:
-                restore = len(lines)
+                restore = nlines
                 sys.stderr.write("Auto restoring after iteration %d\n"% restore)
                 logging.debug("Auto restoring after iteration %d"% restore)
+                # drop the error line or a partly written one, switch format
+                # and close damaged compressed logs, so that appending is safe
+                if not last.endswith('\n') or compress or logname != newlogname:
+                    truncate_log(logname, restore, newlogname, compress)
+                elif index_count(logname) != restore:
+                    build_index(logname)
             
+        # memory instrumentation: the resident memory and its peak (MB) are
+        # logged as _rss and _peak_rss, with 'objects' the object types of 
+        # reset() and iterate() are reported in %i.allocations
+        profile = self.options.profile_memory if self.options.profile_memory is not None else params.get('profile_memory')
+        if profile:
+            reset_peak_rss()
+
         self.reset(params, rep)
+        if profile == 'objects':
+            after_reset = object_census()
         
         if restore:
-            logfile = open(logname, 'a')
-            os.chdir(fullpath)
+            logfile = open_log(newlogname, 'a', compress)
+            self._chdir(fullpath)
             self.restore_state(params, rep, restore)
         else:
-            logfile = open(logname, 'w')
+            logfile = open_log(newlogname, 'w', compress)
+            for filename in glob.glob(array_name(fullpath, rep, '*')) + glob.glob(array_name(fullpath, rep, '*') + '.json'):
+                os.remove(filename)
+        # array sidecars by tag: [file, meta, rows]
+        arrays = {}
+
+        # plain logs get an offset index, appended after every line
+        idxfile = None
+        if not compress:
+            idxfile = open(newlogname + '.idx', 'ab' if restore else 'wb')
+
+        # running summaries of the numeric tags, continued on restore
+        summary = read_summary(newlogname) if restore else None
+        if restore and (summary is None or summary['lines'] != restore):
+            summary = summarize_log(newlogname, restore)
+        if summary is None:
+            summary = new_summary()
+        # time of the last write of the summary (a list, written in write())
+        summary_written = [time.time()]
+        self._publish('start', params, rep, restore=restore)
         
+        # with --pipeline a background thread writes the checkpoints and log
+        # lines of an iteration while the next one runs
+        depth = self.options.pipeline if self.options.pipeline is not None else params.get('pipeline')
+        writer = BackgroundWriter(depth) if depth else None
+
+        def write(it, dic, save, duration):
+            """ writes the checkpoint (if save is given) and then the log line
+                of iteration it.
+            """
+            if save is not None:
+                try:
+                    save()
+                except Exception as exc:
+                    #obtain the exception information, print them but don't break
+                    trc = traceback.format_exc()
+                    self._print_exception(trc, exc, fullpath)
+
+            # array-valued metrics go to their sidecar, the log refers to the row
+            logged = dict(dic)
+            for k, v in dic.iteritems():
+                arr = as_array(v)
+                if arr is not None:
+                    ref = self._append_array(arrays, fullpath, rep, k, arr)
+                    if ref is not None:
+                        logged[k] = ref
+
+            # build string from dictionary
+            outstr = ' '.join(map(lambda x: '%s:%s'%(x[0], str(x[1])), sorted(logged.items())))
+            logfile.write("{}\n".format(outstr))
+            # numbers as they will be read back from the log
+            update_summary(summary, dict((k, parse_value(str(v)) if isinstance(v, numbers.Number) else v)
+                for k, v in logged.iteritems()), it)
+            if not compress or (it + 1) % compress_flush == 0:
+                logfile.flush()
+                if time.time() - summary_written[0] >= SUMMARY_INTERVAL:
+                    write_summary(summary, newlogname)
+                    summary_written[0] = time.time()
+            if idxfile:
+                idxfile.write(INDEX_ITEM.pack(logfile.tell()))
+                idxfile.flush()
+            self._publish('iteration', params, rep, iteration=it, duration=duration, values=logged)
+
         # loop through iterations and call iterate
+        status = True
         for it in xrange(restore, params['iterations']):
             #set path for writing results of iteration
-            os.chdir(fullpath)
+            self._chdir(fullpath)
             #initialize a local logger
             # create file handler which logs even debug messages
             loglevel = logging.DEBUG
             logging.basicConfig(level=loglevel,
             format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
             datefmt='%m-%d %H:%M',
-            filename='debuglog')
+            filename=os.path.join(fullpath, 'debuglog'))
 
+            started = time.time()
+            timer = self._start_iteration_timer()
             try:
                 dic = self.iterate(params, rep, it)
+            except IterationTimeout as exc:
+                sys.stderr.write("iteration %i of %s repetition %i timed out after %s seconds\n"%(it, name, rep, self.iteration_timeout))
+                if writer:
+                    writer.close()
+                logfile.write(TIMEOUT_MARKER)
+                status = 'timeout'
+                self._publish('crash', params, rep, iteration=it, status=status, error=str(exc))
+                break
             except Exception as exc:
                 #obtain the exception information
                 trc = traceback.format_exc()
                 self._print_exception(trc, exc, fullpath)
                 
-                #log the exception on the general rep log
-                logfile.write("exception:error")
+                #log the exception on the general rep log, after the pending lines
+                if writer:
+                    writer.close()
+                logfile.write(ERROR_MARKER)
+                status = 'error'
+                self._publish('crash', params, rep, iteration=it, status=status, error=str(exc))
                 
                 #break the repeat loop (will lead to logfile.close())
                 break
+            finally:
+                if timer:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            duration = time.time() - started
             
+            # a snapshot of the state is saved by the writer before the log
+            # line, otherwise the state is saved now, after the queued log 
+            # lines: a checkpoint must never be ahead of the log
+            save = None
             if self.restore_supported:
-                try:
-                    self.save_state(params, rep, it)
-                except Exception as exc:
-                    #obtain the exception information, print them but don't break
-                    trc = traceback.format_exc()
-                    self._print_exception(trc, exc, fullpath)
+                if writer:
+                    save = self.snapshot_state(params, rep, it)
+                    if save is None:
+                        writer.drain()
+                if save is None:
+                    try:
+                        self.save_state(params, rep, it)
+                    except Exception as exc:
+                        #obtain the exception information, print them but don't break
+                        trc = traceback.format_exc()
+                        self._print_exception(trc, exc, fullpath)
                 
             # replace all spaces in keys with underscores
             for k in dic:
@@ -750,14 +3187,162 @@ class PyExperimentSuite(object):
                     if k not in self.key_warning_issued:
                         print "warning: key '%s' contained spaces and was renamed to '%s'"%(k, newk)    
                         self.key_warning_issued.append(k)
-                
-            # build string from dictionary
-            outstr = ' '.join(map(lambda x: '%s:%s'%(x[0], str(x[1])), sorted(dic.items())))
-            logfile.write("{}\n".format(outstr))
-            logfile.flush()
+
+            if profile:
+                dic['_rss'] = round(current_rss() / 1048576., 1)
+                dic['_peak_rss'] = round(peak_rss() / 1048576., 1)
+
+            if writer:
+                # copies of values that the next iteration may change in place
+                dic = dict((k, copy.copy(v) if isinstance(v, (ndarray, list, dict)) else v) for k, v in dic.iteritems())
+                writer.put(write, it, dic, save, duration)
+            else:
+                write(it, dic, None, duration)
+
+            # memory watermark: stop here and continue in a fresh worker
+            if (self.max_rss and self.restore_supported and it + 1 < params['iterations']
+                    and current_rss() > self.max_rss):
+                sys.stderr.write("%s repetition %i uses %.0f MB after iteration %i, recycling the worker\n"%(name, rep, current_rss() / 1048576., it))
+                if writer:
+                    writer.close()
+                logfile.write(RECYCLED_MARKER)
+                status = 'recycled'
+                break
+        if writer:
+            writer.close()
         logfile.close()
-    
-    
+        write_summary(summary, newlogname)
+        if idxfile:
+            idxfile.close()
+        for store in arrays.values():
+            store[0].close()
+        if profile == 'objects':
+            write_allocation_report(os.path.join(fullpath, '%i.allocations'%rep), after_reset, object_census())
+        self._publish('finish', params, rep, status='done' if status is True else status)
+        os.chdir(cwd)
+        return status
+
+    def cached(self, params, keys, fn, *args, **kwargs):
+        """ returns fn(*args, **kwargs), computed only once for all experiments
+            and repetitions that have the same values of the parameters named
+            in keys (a string or a list of strings), the same args and kwargs
+            and a function of the same name. meant for expensive work in reset()
+            that depends only on some parameters, e.g. loading a dataset:
+            
+                data = self.cached(params, 'dataset', load, params['dataset'])
+            
+            results are pickled to the cache folder (cache_dir), which is shared
+            by all worker processes. a file lock per result makes concurrent 
+            workers wait for the one that computes it. the least recently used
+            results are deleted when the folder grows beyond --cache-size MB.
+        """
+        if isinstance(keys, basestring):
+            keys = [keys]
+        key = hashlib.sha1(pickle.dumps((getattr(fn, '__module__', None), fn.__name__,
+            [(k, params[k]) for k in sorted(keys)], args, sorted(kwargs.items())), 2)).hexdigest()
+        # params['path'] is relative to the launch directory, not to the 
+        # experiment folder that run_rep() changes into
+        cachedir = self.cache_dir or os.path.join(self.results_path or os.path.abspath(params['path']), CACHE_DIR)
+        try:
+            os.makedirs(cachedir)
+        except OSError:
+            if not os.path.isdir(cachedir):
+                raise
+        filename = os.path.join(cachedir, key + '.pkl')
+
+        # results are complete once they have their name (atomic rename)
+        try:
+            f = open(filename, 'rb')
+        except IOError:
+            pass
+        else:
+            try:
+                # an open file can still be read if another process evicts it
+                try:
+                    os.utime(filename, None)
+                except OSError:
+                    pass
+                return pickle.load(f)
+            finally:
+                f.close()
+
+        lockfile = open(filename + '.lock', 'a')
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            # computed by another process while we were waiting (and not
+            # evicted since)
+            try:
+                f = open(filename, 'rb')
+            except IOError:
+                pass
+            else:
+                try:
+                    return pickle.load(f)
+                finally:
+                    f.close()
+            result = fn(*args, **kwargs)
+            f = open(filename + '.tmp', 'wb')
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.rename(filename + '.tmp', filename)
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+            lockfile.close()
+
+        limit = self.options.cache_size
+        if limit is None:
+            limit = params.get('cache_size', 1024)
+        evict_cache(cachedir, int(limit * 1048576), keep=filename)
+        return result
+
+    def _append_array(self, arrays, fullpath, rep, tag, arr):
+        """ appends the value of an array-valued metric to its sidecar and 
+            returns the reference for the log, or None if its shape or dtype
+            differs from the earlier values (then it is logged as text).
+        """
+        meta = {'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+        store = arrays.get(tag)
+        if store is None:
+            filename = array_name(fullpath, rep, tag)
+            store = arrays[tag] = open_array(filename, None if os.path.exists(filename + '.json') else meta)
+        f, stored, nrows = store
+        if stored != meta:
+            logging.warning("value of '%s' has dtype %s and shape %s instead of %s and %s, it is logged as text"%(
+                tag, meta['dtype'], tuple(meta['shape']), stored['dtype'], tuple(stored['shape'])))
+            return None
+        # before the log line that refers to it
+        f.write(arr.tobytes())
+        f.flush()
+        store[2] += 1
+        return '%s%i]'%(ARRAY_REF, nrows)
+
+    def _publish(self, event, params, rep, **fields):
+        """ hands an event of a repetition to the Publisher, if the run is
+            published (--publish).
+        """
+        if _events is not None:
+            fields.update(event=event, exp=params['name'], rep=rep, pid=os.getpid(), time=time.time())
+            publish_event(fields)
+
+    def _start_iteration_timer(self):
+        """ starts the alarm for the iteration timeout, if one is set and this is
+            the main thread (signals don't work in other threads). returns True
+            if the alarm was started.
+        """
+        if not self.iteration_timeout or threading.current_thread().name != 'MainThread':
+            return False
+        signal.signal(signal.SIGALRM, raise_iteration_timeout)
+        signal.setitimer(signal.ITIMER_REAL, self.iteration_timeout)
+        return True
+
+    def _chdir(self, path):
+        """ changes into the experiment folder, unless the repetitions share the
+            working directory of one process (thread executor).
+            self.workdir is the experiment folder with every executor.
+        """
+        if self.executor != 'thread':
+            os.chdir(path)
+
     def _print_exception(self, trc, exc, fullpath):
         sys.stderr.write("\nSuite caught exception: {}\n".format(exc))
         sys.stderr.write("trace\n{}\n".format(trc))
@@ -780,15 +3365,32 @@ class PyExperimentSuite(object):
         return ret
     
     def save_state(self, params, rep, n):
-        """ optionally can be implemented by subclass. """
+        """ optionally can be implemented by subclass. files should be written
+            to self.workdir, the experiment folder: with the thread executor
+            the working directory is shared by all repetitions.
+        """
         pass
+
+    def snapshot_state(self, params, rep, n):
+        """ optionally can be implemented by subclass, for --pipeline: returns 
+            a function without arguments that saves the state after iteration
+            n. It runs in the background writer thread while the next iteration
+            changes the state, so it must use copies of everything it saves, 
+            e.g.
+                weights = self.weights.copy()
+                return lambda: save('weights.npy', weights)
+            return None (the default) to call save_state() instead, after the
+            queued writes are done.
+        """
+        return None
         
     def restore_state(self, params, rep, n):
         """ if the experiment supports restarting within a repetition
             (on iteration level), load necessary stored state in this 
             function. Otherwise, restarting will be done on repetition 
             level, deleting all unfinished repetitions and restarting 
-            the experiments.
+            the experiments. read the files that save_state() wrote to 
+            self.workdir.
         """
         pass
         